@@ -0,0 +1,118 @@
+"""Throughput benchmarks, compared against a committed baseline.
+
+    python -m bench                      run everything, fail on regressions
+    python -m bench move state_to_index  only these benchmarks and the ones under them
+    python -m bench --save-baseline      store the results as the new baseline
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+from time import perf_counter
+from bench.benchmarks import BENCHMARKS
+from logger import logger as logging
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def calibrate(n=200000):
+    """Speed of the machine right now, in iterations per second of a fixed Python loop."""
+    table = {}
+    start = perf_counter()
+    for i in range(n):
+        table[i & 1023] = table.get(i & 1023, 0) + i
+    return n / (perf_counter() - start)
+
+
+def selected(name, prefixes):
+    """Whether benchmark name is one of prefixes, or below one of them:
+    "move/board10" selects "move/board10/len3" but not "move/board100/len3"."""
+    return not prefixes or any(name == prefix or name.startswith(prefix.rstrip("/") + "/") for prefix in prefixes)
+
+
+def run(names, repeat):
+    """Best rate of repeat runs of each benchmark.
+
+    Shared machines change speed from one minute to the next, so each run is
+    preceded by a calibration loop: the score (rate / calibration speed) is
+    what is compared to the baseline. Like timeit, the garbage collector is
+    off while measuring, and a first warm-up run is not counted."""
+    results = {}
+    for name in names:
+        function, args, unit = BENCHMARKS[name]
+        best = 0
+        best_score = 0
+        function(*args)
+        for _ in range(repeat):
+            gc.collect()
+            gc.disable()
+            try:
+                speed = calibrate()
+                count, seconds = function(*args)
+            finally:
+                gc.enable()
+            best = max(best, count / seconds)
+            best_score = max(best_score, count / seconds / speed)
+        results[name] = {"rate": best, "score": best_score, "unit": unit}
+        logging.info(f"{name:<24} {best:14.1f} {unit}")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Names of the benchmarks slower than their baseline by more than threshold."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        change = result["score"] / baseline[name]["score"] - 1
+        status = "REGRESSION" if change < -threshold else "ok"
+        logging.info(f"{name:<24} {change * 100:+7.1f} % {status}")
+        if change < -threshold:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("python -m bench", description="Benchmarks de performance")
+    parser.add_argument("names", nargs="*", help="Noms ou groupes de benchmarks à lancer, comme move/board10 (tous par défaut)")
+    parser.add_argument("--repeat", default=7, type=int, help="Nombre de mesures par benchmark (la meilleure est gardée)")
+    parser.add_argument("--output", default="bench_results.json", help="Fichier JSON des résultats")
+    parser.add_argument("--baseline", default=BASELINE, help="Fichier JSON de référence")
+    parser.add_argument("--threshold", default=0.25, type=float, help="Ralentissement toléré avant d'échouer (0.25 = 25 %%)")
+    parser.add_argument("--save-baseline", action="store_true", help="Enregistrer les résultats comme nouvelle référence")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if selected(name, args.names)]
+    if not names:
+        parser.error("Aucun benchmark ne correspond")
+    if args.repeat < 1:
+        parser.error("--repeat doit être au moins 1")
+
+    results = run(names, args.repeat)
+    report = {"python": platform.python_version(), "machine": platform.machine(), "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)["results"]
+        baseline.update(results)
+        report["results"] = baseline
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Baseline saved to {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        logging.warning(f"No baseline found at {args.baseline}")
+        sys.exit(0)
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        logging.error(f"{len(regressions)} regression(s) above {args.threshold * 100:.0f} %: {', '.join(regressions)}")
+        sys.exit(1)
@@ -0,0 +1,173 @@
+import os
+import random
+import tempfile
+from importlib import import_module
+from time import perf_counter
+import numpy as np
+from snake import Snake, DIRECTIONS, game_seed, load_history, random_walk, BOARD_SIZE
+from env import Env
+from evaluate import play_game
+from policy import choose_action, q_update
+from replay import ReplayWriter, ReplayReader, load_replay
+from v3.strategy import hamiltonian_cycle
+
+MODELS = ["v0", "v1", "v2", "v3"]
+
+
+def _sample_snakes(count, seed=0, board_size=BOARD_SIZE):
+    """Snakes in the states met by random games."""
+    rng = random.Random(seed)
+    snakes = []
+    game = 0
+    while len(snakes) < count:
+        snake = Snake(board_size=board_size, history_mode="off", seed=game_seed(seed, game))
+        snakes.append(Snake(board_size=board_size, state=snake._get_state(), history_mode="off"))
+        for result, _ in random_walk(snake, count - len(snakes), rng):
+            if not result:
+                break
+            snakes.append(Snake(board_size=board_size, state=snake._get_state(), history_mode="off"))
+        game += 1
+    return snakes
+
+
+def snake_move(board_size, length, nmoves=100000):
+    """Snake.move along a hamiltonian cycle, without apples so the length is constant."""
+    cycle = hamiltonian_cycle(board_size)
+    dir_of = {delta: dir for dir, delta in enumerate(DIRECTIONS)}
+    dirs = []
+    for i, (row, col) in enumerate(cycle):
+        next_row, next_col = cycle[(i + 1) % len(cycle)]
+        dirs.append(dir_of[(next_row - row, next_col - col)])
+    dir_at = {cell: dir for cell, dir in zip(cycle, dirs)}
+
+    state = {
+        "positions": [cycle[-i] for i in range(1, length + 1)],
+        "dir": dirs[-2],
+        "green_apples": [],
+        "red_apples": [],
+    }
+    snake = Snake(board_size=board_size, state=state, history_mode="off")
+
+    start = perf_counter()
+    for _ in range(nmoves):
+        snake.set_dir(dir_at[snake.body[0]])
+        snake.move()
+    return nmoves, perf_counter() - start
+
+
+def state_to_index(model, board_size=BOARD_SIZE, nstates=2000, rounds=20):
+    strategy = import_module(f"{model}.strategy")
+    snakes = _sample_snakes(nstates, board_size=board_size)
+    encode = strategy.state_to_index
+
+    start = perf_counter()
+    for _ in range(rounds):
+        for snake in snakes:
+            encode(snake)
+    return nstates * rounds, perf_counter() - start
+
+
+def train_episodes(model, nepisodes=300):
+    """Episodes of the train loop, headless, on a fresh Q-table."""
+    strategy = import_module(f"{model}.strategy")
+    action_type = "dir" if model == "v3" else "turn"
+    env = Env(strategy, action_type)
+    rewards = strategy.REWARDS
+    q_table = np.zeros_like(strategy.Q_table)
+    rng = random.Random(0)
+    epsilon = 1.0
+
+    start = perf_counter()
+    for episode in range(nepisodes):
+        state = env.reset(Snake(history_mode="off", seed=game_seed(0, episode)))
+        nmoves = 0
+        done = False
+        while not done and nmoves < 1000:
+            action = int(choose_action(q_table, state, epsilon, rng))
+            next_state, event, done = env.step(action)
+            q_update(q_table, state, action, rewards[event], next_state, 0.1, 0.9)
+            state = next_state
+            nmoves += 1
+        epsilon *= 0.99
+    return nepisodes, perf_counter() - start
+
+
+def play_games(model, ngames=50):
+    """Greedy games of the trained model, headless."""
+    strategy = import_module(f"{model}.strategy")
+    action_type = "dir" if model == "v3" else "turn"
+    q_table = np.load(os.path.join(model, "Q_table.npy"))
+
+    start = perf_counter()
+    for game in range(ngames):
+        snake = Snake(history_mode="off", seed=game_seed(0, game))
+        play_game(snake, q_table, strategy.state_to_index, action_type, max_moves=1000)
+    return ngames, perf_counter() - start
+
+
+def _random_game(history_mode, nmoves, writer_file=None):
+    rng = random.Random(1)
+    snake = Snake(history_mode=history_mode, seed=1)
+    writer = ReplayWriter(writer_file, snake) if writer_file else None
+    for result, _ in random_walk(snake, nmoves, rng):
+        if not result:
+            # Keep the game going: turn back to a fresh game state
+            snake.dir = (snake.dir + 1) % 4
+        if writer:
+            writer.record(snake)
+    if writer:
+        writer.close()
+    return snake
+
+
+def history_save_load(history_mode, nmoves=5000):
+    """save_game then load_history of a game of nmoves, in moves per second."""
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "game.json")
+        snake = _random_game(history_mode, nmoves)
+        start = perf_counter()
+        snake.save_game(filename)
+        load_history(filename)
+        return nmoves, perf_counter() - start
+
+
+def replay_load(nmoves=20000):
+    """load_replay of a binary replay of nmoves, in moves per second."""
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "game.replay")
+        _random_game("off", nmoves, filename)
+        start = perf_counter()
+        load_replay(filename)
+        return nmoves, perf_counter() - start
+
+
+def replay_seek(nseeks=1000, nmoves=20000):
+    """Random seeks in a binary replay of nmoves."""
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "game.replay")
+        _random_game("off", nmoves, filename)
+        rng = random.Random(2)
+        with ReplayReader(filename) as reader:
+            reader.seek(len(reader) - 1)
+            start = perf_counter()
+            for _ in range(nseeks):
+                reader.seek(rng.randrange(len(reader)))
+            return nseeks, perf_counter() - start
+
+
+# name: (function, arguments, unit)
+BENCHMARKS = {}
+for _board_size, _lengths in ((10, (3, 20, 50)), (20, (3, 100, 300)), (50, (3, 1000)), (100, (3, 3000))):
+    for _length in _lengths:
+        BENCHMARKS[f"move/board{_board_size}/len{_length}"] = (snake_move, (_board_size, _length), "moves/s")
+for _model in MODELS:
+    BENCHMARKS[f"state_to_index/{_model}"] = (state_to_index, (_model,), "states/s")
+    BENCHMARKS[f"state_to_index/{_model}/board100"] = (state_to_index, (_model, 100), "states/s")
+for _model in MODELS:
+    BENCHMARKS[f"train/{_model}"] = (train_episodes, (_model,), "episodes/s")
+for _model in MODELS:
+    BENCHMARKS[f"test/{_model}"] = (play_games, (_model,), "games/s")
+for _mode in ("full", "delta"):
+    BENCHMARKS[f"history/{_mode}"] = (history_save_load, (_mode,), "moves/s")
+BENCHMARKS["replay/load"] = (replay_load, (), "moves/s")
+BENCHMARKS["replay/seek"] = (replay_seek, (), "seeks/s")
@@ -0,0 +1,182 @@
+import os
+import json
+import random
+import signal
+import threading
+import time
+import numpy as np
+from qstore import copy_table, assign, check_compatible, table_arrays, table_from_arrays, model_filename, save_q_table
+from logger import logger as logging
+
+
+def atomic_save(filename, save):
+    """Calls save(file) on a temporary file, then renames it to filename.
+
+    A crash while writing leaves the previous version of filename untouched."""
+    tmp = f"{filename}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            save(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, filename)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def get_rng_state(rng):
+    """JSON-serializable state of a random.Random or a numpy Generator."""
+    if isinstance(rng, random.Random):
+        version, internal, gauss = rng.getstate()
+        return json.dumps({"type": "random", "state": [version, internal, gauss]})
+    return json.dumps({"type": "numpy", "state": rng.bit_generator.state})
+
+
+def set_rng_state(rng, state):
+    state = json.loads(state)
+    if state["type"] == "random":
+        version, internal, gauss = state["state"]
+        rng.setstate((version, tuple(internal), gauss))
+    else:
+        rng.bit_generator.state = state["state"]
+
+
+def save_checkpoint(filename, q_table, episode, epsilon, rng_state, arrays=None):
+    """Writes a training checkpoint: Q-table, number of episodes done, epsilon and RNG state.
+
+    arrays are the extra named arrays of the other learning parts (see Checkpointer)."""
+    atomic_save(filename, lambda f: np.savez(
+        f, **table_arrays(q_table), episode=episode, epsilon=epsilon, rng_state=rng_state, **(arrays or {}),
+    ))
+
+
+def load_checkpoint(filename):
+    with np.load(filename) as data:
+        known = {"q_table", "q_states", "q_rows", "q_shape", "episode", "epsilon", "rng_state"}
+        return {
+            "q_table": table_from_arrays(data),
+            "episode": int(data["episode"]),
+            "epsilon": float(data["epsilon"]),
+            "rng_state": str(data["rng_state"]),
+            "arrays": {name: data[name] for name in data.files if name not in known},
+        }
+
+
+class Checkpointer:
+    """Saves a checkpoint every `every` episodes or `seconds` seconds.
+
+    The Q-table and the RNG state are copied in the training loop, the file is
+    written by a background thread. Only one write is in flight at a time.
+    parts are the other objects learning along the Q-table (the Dyna-Q model,
+    the replay buffer): their checkpoint_arrays() are saved with it, and
+    restore_checkpoint gives them back to their restore_arrays()."""
+
+    def __init__(self, filename, every=100, seconds=60, first_episode=0, parts=()):
+        self.filename = filename
+        self.parts = parts
+        self.every = every
+        self.seconds = seconds
+        self.last_episode = first_episode
+        self.last_time = time.monotonic()
+        self.thread = None
+
+    def step(self, episode, q_table, epsilon, rng):
+        """Called with the number of episodes done, saves if a checkpoint is due."""
+        if episode - self.last_episode >= self.every or time.monotonic() - self.last_time >= self.seconds:
+            self.save(episode, q_table, epsilon, rng)
+
+    def save(self, episode, q_table, epsilon, rng):
+        arrays = {}
+        for part in self.parts:
+            arrays.update(part.checkpoint_arrays())
+        args = (self.filename, copy_table(q_table), episode, epsilon, get_rng_state(rng), arrays)
+        self.wait()
+        self.thread = threading.Thread(target=save_checkpoint, args=args)
+        self.thread.start()
+        self.last_episode = episode
+        self.last_time = time.monotonic()
+
+    def wait(self):
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+
+class StopRequest:
+    """Context manager turning the first Ctrl-C into a request to stop.
+
+    Training checks `requested` at episode boundaries, so the checkpoint saved
+    on interrupt never holds half an episode. A second Ctrl-C raises
+    KeyboardInterrupt at once, without saving. Signals are only handled in the
+    main thread: elsewhere (--spectate) nothing changes."""
+
+    def __init__(self):
+        self.requested = False
+        self.previous = None
+
+    def __enter__(self):
+        if threading.current_thread() is threading.main_thread():
+            self.previous = signal.signal(signal.SIGINT, self._handle)
+        return self
+
+    def __exit__(self, *exc):
+        if self.previous is not None:
+            signal.signal(signal.SIGINT, self.previous)
+
+    def _handle(self, signum, frame):
+        if self.requested:
+            raise KeyboardInterrupt
+        self.requested = True
+        logging.warning("Interrupted, stopping at the end of the current episode (Ctrl-C again to abort)")
+
+
+def check_checkpoint(filename, q_table):
+    """Raises ValueError if the checkpoint at filename, when there is one, was
+    taken with another Q-table backend or shape (--q-store, --board-size)."""
+    if os.path.exists(filename):
+        _check_table(filename, q_table, load_checkpoint(filename))
+
+
+def _check_table(filename, q_table, checkpoint):
+    try:
+        check_compatible(q_table, checkpoint["q_table"])
+    except ValueError as e:
+        raise ValueError(f"{filename} : {e}") from None
+
+
+def restore_checkpoint(filename, q_table, rng, parts=()):
+    """Loads a checkpoint into q_table, rng and parts, returns (episodes done, epsilon).
+
+    Without checkpoint, training starts from scratch: (0, 1.0)."""
+    if not os.path.exists(filename):
+        logging.warning(f"No checkpoint found at {filename}, starting from scratch")
+        return 0, 1.0
+    checkpoint = load_checkpoint(filename)
+    _check_table(filename, q_table, checkpoint)
+    assign(q_table, checkpoint["q_table"])
+    set_rng_state(rng, checkpoint["rng_state"])
+    for part in parts:
+        part.restore_arrays(checkpoint["arrays"])
+    logging.info(f"Resuming after episode {checkpoint['episode']} with epsilon {checkpoint['epsilon']:.4f}")
+    return checkpoint["episode"], checkpoint["epsilon"]
+
+
+def save_model(model_name, q_table, precision="float32"):
+    """Writes model_name/Q_table.npy (or .npz for a sparse table) atomically,
+    with the scale factor in Q_table.json when it is quantized to int16.
+
+    The files of the other formats are removed, so that loading finds this one."""
+    filename = model_filename(model_name, q_table)
+    scale = []
+    atomic_save(filename, lambda f: scale.append(save_q_table(f, q_table, precision)))
+    kept = [filename]
+    if scale[0] is not None:
+        scale_file = os.path.join(model_name, "Q_table.json")
+        atomic_save(scale_file, lambda f: f.write(json.dumps({"scale": scale[0]}).encode()))
+        kept.append(scale_file)
+    for other in ("Q_table.npy", "Q_table.npz", "Q_table.json"):
+        other = os.path.join(model_name, other)
+        if other not in kept and os.path.exists(other):
+            os.remove(other)
@@ -0,0 +1,44 @@
+from snake import Snake, apply_action, DEATH
+from transposition import TranspositionCache
+import instrument
+
+
+class Env:
+    """Q-learning transitions of a Snake for one strategy.
+
+    Each step encodes the new state once and keeps it as the state of the
+    next step, and reports what happened as an integer event code that
+    indexes the strategy's REWARDS table. State encodings are memoized in a
+    TranspositionCache of cache_size boards (0 to disable it)."""
+
+    def __init__(self, strategy_module, action_type, cache_size=1 << 16):
+        state_to_index = strategy_module.state_to_index
+        if cache_size:
+            state_to_index = TranspositionCache(state_to_index, cache_size)
+        self.state_to_index = instrument.wrap("state", state_to_index)
+        self.move = instrument.wrap("move", Snake.step)
+        self.reward_event = strategy_module.reward_event
+        self.action_type = action_type
+        self.snake = None
+        self.state = None
+        self.scenari = None
+
+    def reset(self, snake):
+        """Starts following snake, returns its state index."""
+        self.snake = snake
+        self.state = self.state_to_index(snake)
+        return self.state
+
+    def step(self, action):
+        """Plays action, returns (next state index, event code, done).
+
+        The next state is None when the move ended the game."""
+        snake = self.snake
+        previous = (snake.get_head_position(), snake.dir)
+        apply_action(snake, self.action_type, action)
+        res, self.scenari = self.move(snake)
+
+        done = not res
+        event = self.reward_event(self.scenari + DEATH * done, snake, previous)
+        self.state = None if done else self.state_to_index(snake)
+        return self.state, event, done
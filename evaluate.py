@@ -0,0 +1,149 @@
+import os
+import random
+import multiprocessing as mp
+from collections import Counter
+from importlib import import_module
+import numpy as np
+from snake import Snake, apply_action, game_seed, BOARD_SIZE
+from replay import ReplayWriter
+from shared_table import SharedTable, worker_results, stop_workers
+from qstore import load_q_table, is_mapped
+from metrics import MetricsWriter, DEATH_CODES, LIMIT
+from logger import logger as logging
+
+MAX_MOVES = 100000
+
+
+class LoopDetector:
+    """Detects that a game played by a deterministic policy repeats itself.
+
+    Between two apple events the apples don't move and the RNG is not used, so
+    when the snake comes back to a state (head, direction, body) it already had
+    since the last apple, the game loops forever. States are compared with
+    Brent's algorithm: one state is kept and replaced after 1, 2, 4, 8... moves,
+    so a loop is found within a few times its length, in O(1) amortized per move.
+    The Zobrist hash of the snake rules out most states before the bodies are compared."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.saved = None
+        self.power = 1
+        self.steps = 0
+
+    def check(self, snake, apple_eaten):
+        """Called after each move, returns True when the game is looping."""
+        if apple_eaten:
+            self.reset()
+            return False
+        saved = self.saved
+        if saved and snake.zobrist == saved[0] and snake.dir == saved[1] and snake.body == saved[2]:
+            return True
+        self.steps += 1
+        if self.steps == self.power:
+            self.saved = (snake.zobrist, snake.dir, snake.body.copy())
+            self.power *= 2
+            self.steps = 0
+        return False
+
+
+def play_game(snake, q_table, state_to_index, action_type, writer=None, max_moves=MAX_MOVES):
+    """Plays one game with the greedy policy of q_table.
+
+    Returns (score, death scenario, number of moves). The scenario is "loop"
+    when the game was stopped because it repeated itself."""
+    nmoves = 0
+    result = True
+    scenari = None
+    loop = LoopDetector()
+    while result and nmoves < max_moves:
+        state = state_to_index(snake)
+        apply_action(snake, action_type, int(np.argmax(q_table[state])))
+        result, scenari = snake.move()
+        if writer:
+            writer.record(snake)
+        nmoves += 1
+        if result and loop.check(snake, scenari in ("green", "red")):
+            scenari = "loop"
+            break
+    return snake.get_score(), scenari, nmoves
+
+
+def _worker(worker_id, model_name, table_spec, first_game, last_game, seed, save_dir, board_size, queue):
+    strategy_module = import_module(f"{model_name}.strategy")
+    # Without shared memory block, the model file is mapped again: the pages are shared by the OS
+    table = SharedTable.attach(*table_spec) if table_spec else None
+    if table:
+        table.array.flags.writeable = False
+    q_table = table.array if table else load_q_table(model_name)
+    action_type = "dir" if model_name == "v3" else "turn"
+    if save_dir:
+        save_dir = os.path.join(save_dir, f"worker_{worker_id}")
+        os.makedirs(save_dir, exist_ok=True)
+
+    try:
+        for game in range(first_game, last_game):
+            snake = Snake(board_size=board_size, history_mode="off", seed=game_seed(seed, game))
+            writer = ReplayWriter(os.path.join(save_dir, f"game_{game}.replay"), snake) if save_dir else None
+            score, scenari, nmoves = play_game(snake, q_table, strategy_module.state_to_index, action_type, writer)
+            if writer:
+                writer.close()
+            queue.put((worker_id, game, score, scenari, nmoves))
+    finally:
+        queue.put((worker_id, None, None, None, None))
+        if table:
+            table.close()
+
+
+def evaluate(model_name, q_table, ngames, nworkers, save_dir=None, seed=None, metrics_file=None, board_size=BOARD_SIZE):
+    """Plays ngames split across nworkers processes and logs a merged report.
+
+    A Q-table memory-mapped from the model file is mapped again by each
+    worker, any other one is put once in shared memory. Game n is always
+    played with game_seed(seed, n), whatever the number of workers."""
+    if seed is None:
+        seed = random.getrandbits(32)
+    logging.info(f"Seed: {seed}")
+
+    table = None if is_mapped(q_table) else SharedTable.create(np.asarray(q_table))
+    table_spec = table.spec() if table else None
+    queue = mp.Queue()
+    bounds = np.linspace(0, ngames, nworkers + 1).astype(int)
+    workers = [
+        mp.Process(target=_worker, args=(k, model_name, table_spec, bounds[k], bounds[k + 1], seed, save_dir, board_size, queue))
+        for k in range(nworkers)
+    ]
+
+    metrics = MetricsWriter(metrics_file, report_every=0)
+    scores = []
+    deaths = Counter()
+    worker_scores = [[] for _ in range(nworkers)]
+    try:
+        for worker in workers:
+            worker.start()
+        for worker_id, game, score, scenari, nmoves in worker_results(queue, workers):
+            logging.info(f'Episode: {game} Score: {score} Death: {scenari} Moves: {nmoves}')
+            scores.append(score)
+            deaths[scenari] += 1
+            metrics.record(game, score, nmoves, DEATH_CODES[scenari] if nmoves < MAX_MOVES else LIMIT)
+            worker_scores[worker_id].append(score)
+        for worker in workers:
+            worker.join()
+    finally:
+        stop_workers(workers)
+        if table:
+            table.unlink()
+        metrics.flush()
+
+    if len(scores) < ngames:
+        logging.warning(f"Only {len(scores)}/{ngames} games were played")
+    if not scores:
+        return scores
+
+    logging.info(f'Average score: {np.mean(scores)} Max: {max(scores)} Min: {min(scores)}')
+    logging.info("Deaths: " + ", ".join(f"{cause}: {count}" for cause, count in deaths.most_common()))
+    for worker_id, values in enumerate(worker_scores):
+        if values:
+            logging.info(f"Worker {worker_id}: {len(values)} games, average score: {np.mean(values):.2f}")
+    return scores
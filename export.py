@@ -0,0 +1,113 @@
+import os
+import glob
+import multiprocessing as mp
+from replay import open_game
+from shared_table import worker_results, stop_workers
+from logger import logger as logging
+
+FORMATS = ["gif", "png"]
+# The GIF encoder keeps every frame until the file is written: longer games
+# are subsampled down to this number of frames
+MAX_GIF_FRAMES = 1000
+
+
+def find_games(directory="replays"):
+    """Saved games of directory and its subdirectories (binary replays and JSON histories)."""
+    files = glob.glob(os.path.join(directory, "**", "*.replay"), recursive=True)
+    files += glob.glob(os.path.join(directory, "**", "*.json"), recursive=True)
+    return sorted(files)
+
+
+def headless_ui():
+    """UI drawing on an off-screen surface, through the SDL dummy video driver."""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    # Imported here so that pygame is initialized after the driver is chosen
+    from snakeUI import UI
+    return UI()
+
+
+def export_game(ui, filename, output_dir, format="gif", fps=10, every=1):
+    """Renders every `every`-th state of a saved game with ui.
+
+    gif writes output_dir/<name>.gif, png writes output_dir/<name>/frame_NNNNN.png.
+    GIF frames are drawn as the encoder asks for them, and at most
+    MAX_GIF_FRAMES of them are written. Returns the number of frames written."""
+    import pygame
+
+    name = os.path.splitext(os.path.basename(filename))[0]
+    reader = open_game(filename)
+    ui.invalidate()
+
+    def draw(index):
+        ui.draw(reader.seek(index))
+        return ui.screen
+
+    try:
+        if format == "gif" and len(reader) > MAX_GIF_FRAMES * every:
+            every = -(-len(reader) // MAX_GIF_FRAMES)
+            logging.warning(f"{filename}: {len(reader)} states, exporting one out of {every} to the GIF")
+        indices = list(range(0, len(reader), every))
+        if indices[-1] != len(reader) - 1:
+            indices.append(len(reader) - 1)
+        if format == "png":
+            frame_dir = os.path.join(output_dir, name)
+            os.makedirs(frame_dir, exist_ok=True)
+            for n, index in enumerate(indices):
+                pygame.image.save(draw(index), os.path.join(frame_dir, f"frame_{n:05d}.png"))
+        else:
+            from PIL import Image
+            size = ui.screen.get_size()
+            images = (Image.frombytes("RGB", size, pygame.image.tobytes(draw(index), "RGB")) for index in indices)
+            next(images).save(os.path.join(output_dir, f"{name}.gif"), save_all=True,
+                              append_images=images, duration=1000 // fps, loop=0)
+    finally:
+        reader.close()
+    return len(indices)
+
+
+def _worker(worker_id, filenames, output_dir, format, fps, every, queue):
+    ui = headless_ui()
+    try:
+        for filename in filenames:
+            try:
+                nframes = export_game(ui, filename, output_dir, format, fps, every)
+                queue.put((worker_id, filename, nframes, None))
+            except Exception as e:
+                queue.put((worker_id, filename, 0, str(e)))
+    finally:
+        queue.put((worker_id, None, None, None))
+        ui.quit()
+
+
+def export(filenames, output_dir="exports", format="gif", fps=10, every=1, nworkers=1):
+    """Exports saved games split across nworkers processes, each with its own headless UI.
+
+    Returns the number of games exported."""
+    if format not in FORMATS:
+        raise ValueError(f"Format d'export invalide : {format}")
+    os.makedirs(output_dir, exist_ok=True)
+    nworkers = max(1, min(nworkers, len(filenames)))
+    queue = mp.Queue()
+    workers = [
+        mp.Process(target=_worker, args=(k, filenames[k::nworkers], output_dir, format, fps, every, queue))
+        for k in range(nworkers)
+    ]
+
+    exported = 0
+    try:
+        for worker in workers:
+            worker.start()
+        for worker_id, filename, nframes, error in worker_results(queue, workers):
+            if error:
+                logging.error(f"{filename}: {error}")
+            else:
+                exported += 1
+                logging.info(f"{filename}: {nframes} frames (worker {worker_id})")
+        for worker in workers:
+            worker.join()
+    finally:
+        stop_workers(workers)
+
+    logging.info(f"{exported}/{len(filenames)} games exported to {output_dir}")
+    return exported
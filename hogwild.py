@@ -0,0 +1,89 @@
+import random
+import multiprocessing as mp
+from importlib import import_module
+import numpy as np
+from snake import Snake, game_seed, BOARD_SIZE
+from policy import choose_action, q_update
+from env import Env
+from shared_table import SharedTable, worker_results, stop_workers
+from checkpoint import save_model
+from metrics import MetricsWriter, LIMIT
+from logger import logger as logging
+
+
+def _worker(worker_id, model_name, table_spec, episodes, seed, nworkers, board_size, queue):
+    """Runs its episodes, updating the shared Q-table in place without locks."""
+    gamma = 0.9
+    alpha = 0.1
+    epsilon = 1.0
+    # Each worker plays 1/nworkers of the episodes: decay faster so the overall
+    # schedule matches the sequential one
+    epsilon_decay = 0.99 ** nworkers
+
+    strategy_module = import_module(f"{model_name}.strategy")
+    action_type = "dir" if model_name == "v3" else "turn"
+    env = Env(strategy_module, action_type)
+    rewards = strategy_module.REWARDS
+    table = SharedTable.attach(*table_spec)
+    q_table = table.array
+    rng = random.Random(f"{seed}-{worker_id}")
+
+    try:
+        for episode in episodes:
+            snake = Snake(board_size=board_size, history_mode="off", seed=game_seed(seed, episode))
+            state = env.reset(snake)
+            nmoves = 0
+            done = False
+            while not done and nmoves < 1000:
+                action = int(choose_action(q_table, state, epsilon, rng))
+                next_state, event, done = env.step(action)
+                q_update(q_table, state, action, rewards[event], next_state, alpha, gamma)
+                state = next_state
+                nmoves += 1
+
+            queue.put((worker_id, episode, snake.get_score(), nmoves, env.scenari if done else LIMIT, epsilon))
+            epsilon *= epsilon_decay
+    finally:
+        queue.put((worker_id, None, None, None, None, None))
+        table.close()
+
+
+def train_parallel(q_table, model_name, print_learning_progress, nworkers, seed=None, checkpoint_every=500, metrics_file=None,
+                   num_episodes=2000, board_size=BOARD_SIZE, precision="float32"):
+    """Hogwild training: nworkers processes update one shared Q-table concurrently.
+
+    The tables are tiny and updates touch a single entry, so lost updates
+    are rare and cheap. This process only logs, checkpoints every
+    checkpoint_every episodes and saves the final table."""
+    if seed is None:
+        seed = random.getrandbits(32)
+    logging.info(f"Seed: {seed}")
+
+    table = SharedTable.create(np.asarray(q_table))
+    metrics = MetricsWriter(metrics_file)
+    queue = mp.Queue()
+    workers = [
+        mp.Process(target=_worker, args=(k, model_name, table.spec(), range(k, num_episodes, nworkers), seed, nworkers, board_size, queue))
+        for k in range(nworkers)
+    ]
+
+    try:
+        for worker in workers:
+            worker.start()
+        done = 0
+        for worker_id, episode, score, nmoves, death, epsilon in worker_results(queue, workers):
+            done += 1
+            metrics.record(episode, score, nmoves, death, epsilon)
+            if done % checkpoint_every == 0:
+                save_model(model_name, table.array, precision)
+        for worker in workers:
+            worker.join()
+
+        q_table[...] = table.array
+    finally:
+        stop_workers(workers)
+        table.unlink()
+        metrics.close()
+
+    print_learning_progress(q_table, verbose = "full")
+    save_model(model_name, q_table, precision)
@@ -1,35 +1,52 @@
 import argparse
-import json
 import os
 import random
 import numpy as np
 from importlib import import_module
 from snakeUI import UI
-from snake import Snake
+from snake import Snake, apply_action, game_seed, BOARD_SIZE
+from evaluate import evaluate, LoopDetector
+from hogwild import train_parallel
+from policy import choose_action, batch_choose_action, q_update, batch_q_update
+from env import Env
+from replay import ReplayWriter, open_game
+from export import export, find_games, FORMATS
+from snake_batch import SnakeBatch
+from spectator import Spectator
+from checkpoint import Checkpointer, StopRequest, check_checkpoint, restore_checkpoint, save_model
+from metrics import MetricsWriter, DEATH_CODES, LIMIT
+from transitions import ReplayLearner
+from planning import PlanningModel, model_bytes, MAX_MODEL_BYTES
+from qstore import SparseQTable, load_q_table, model_filename, is_dense, STORES, PRECISIONS
 import shutil
+import instrument
 from logger import logger as logging
 
 
-def load(model_name, train=False):
+def load(model_name, train=False, board_size=None, store="dense", max_states=None):
+    """Strategy of model_name, with an empty Q-table of the store backend sized
+    for board_size when training, its saved Q-table otherwise (checked against
+    board_size if given)."""
     strategy_module = import_module(f"{model_name}.strategy")
     state_to_index = strategy_module.state_to_index
-    update_q_table = strategy_module.update_Q_table
     print_Q_table_entry = strategy_module.print_Q_table_entry
     print_learning_progress = strategy_module.print_learning_progress
 
     if train:
-        q_table = strategy_module.Q_table
+        shape = strategy_module.table_shape(board_size or BOARD_SIZE)
+        q_table = SparseQTable(*shape, max_states) if store == "sparse" else np.zeros(shape)
     else:
-        model_path = os.path.join(model_name, "Q_table.npy")
-        q_table = np.load(model_path)
-    return q_table, state_to_index, update_q_table, print_Q_table_entry, print_learning_progress
+        q_table = load_q_table(model_name)
+        if board_size and q_table.shape != strategy_module.table_shape(board_size):
+            raise ValueError(f"{model_filename(model_name, q_table)} ne correspond pas à un plateau de taille {board_size}")
+    return q_table, state_to_index, print_Q_table_entry, print_learning_progress
 
-def play():
-    ui = UI()
+def play(board_size=BOARD_SIZE):
+    ui = UI(board_size=board_size)
     playing = True
 
     while playing:
-        snake = Snake()
+        snake = Snake(board_size=board_size, history_mode="delta")
         running = True
 
         while running:
@@ -54,75 +71,171 @@ def play():
 
     ui.quit()
 
-def choose_action(q_table, state, epsilon):
-    if random.uniform(0, 1) < epsilon:
-        return random.randint(0, 2)
-    else:
-        for i in range(len(q_table[state])):
-            if q_table[state][i] == 0:
-                return i
-        return np.argmax(q_table[state])
-
-def apply_action(snake, type, action):
-    if type == "turn":
-        if action == 0:
-            snake.turn("left")
-        elif action == 1:
-            snake.turn("right")
-    elif type == "dir":
-        snake.set_dir(action)
-
-def train(ui_flag, q_table, state_to_index, update_q_table, model_name, print_learning_progress):
+def train(ui_flag, q_table, model_name, print_learning_progress, seed=None, spectator=None, resume=False, metrics_file=None, replay_size=0,
+          num_episodes=2000, plan_sweeps=0, board_size=BOARD_SIZE, precision="float32"):
     gamma = 0.9
     alpha = 0.1
     epsilon = 1.0
     epsilon_decay = 0.99
-    num_episodes = 2000
+    rng = random.Random(seed)
 
-    if ui_flag:
-        ui = UI()
+    strategy_module = import_module(f"{model_name}.strategy")
+    action_type = "dir" if model_name == "v3" else "turn"
+    env = Env(strategy_module, action_type)
+    rewards = strategy_module.REWARDS
+    update = instrument.wrap("q_update", q_update)
+    # With replay_size, moves are stored and learned by batches of sampled transitions
+    learner = ReplayLearner(q_table, alpha, gamma, replay_size, seed=seed) if replay_size else None
+    # With plan_sweeps, a model of the moves is learned and solved after each episode (Dyna-Q)
+    model = None
+    if plan_sweeps:
+        model = PlanningModel(*q_table.shape)
+        plan = instrument.wrap("plan", model.plan)
+    # The replay buffer and the model are checkpointed with the Q-table, so a resumed run is exact
+    parts = [part for part in (learner, model) if part]
+
+    checkpoint_file = os.path.join(model_name, "checkpoint.npz")
+    first_episode = 0
+    if resume:
+        first_episode, epsilon = restore_checkpoint(checkpoint_file, q_table, rng, parts)
+    checkpointer = Checkpointer(checkpoint_file, first_episode=first_episode, parts=parts)
+    episodes_done = first_episode
+    metrics = MetricsWriter(metrics_file)
 
-    for episode in range(num_episodes):
-        snake = Snake()
-        nmoves = 0
-        result = True
+    if ui_flag:
+        ui = UI(board_size=board_size)
+        render = instrument.wrap("render", ui.render)
 
-        while result and nmoves < 1000:
-            if ui_flag:
-                ui.render(snake)
-                input_type, _ = ui.get_spectator_input()
-                if input_type == "quit":
+    with StopRequest() as stop:
+        for episode in range(first_episode, num_episodes):
+            if stop.requested:
+                logging.warning(f"Interrupted after {episodes_done} episodes")
+                break
+            if spectator:
+                if spectator.stopped.is_set():
                     break
+                spectator.start_episode(episode)
+            snake = Snake(board_size=board_size, history_mode="off", seed=None if seed is None else game_seed(seed, episode))
+            state = env.reset(snake)
+            previous_q_table = q_table.copy() if is_dense(q_table) else None
+            nmoves = 0
+            done = False
+
+            while not done and nmoves < 1000:
+                if ui_flag:
+                    render(snake)
+                    input_type, _ = ui.get_spectator_input()
+                    if input_type == "quit":
+                        break
+
+                action = int(choose_action(q_table, state, epsilon, rng))
+                next_state, event, done = env.step(action)
+                if learner:
+                    learner.add(state, action, rewards[event], next_state)
+                else:
+                    update(q_table, state, action, rewards[event], next_state, alpha, gamma)
+                if model:
+                    model.record(state, action, rewards[event], next_state)
+                state = next_state
+                if spectator:
+                    spectator.publish(snake)
+
+                nmoves += 1
+
+            if model:
+                plan(q_table, gamma, plan_sweeps)
+            q_delta = np.nan if previous_q_table is None else np.abs(q_table - previous_q_table).sum()
+            metrics.record(episode, snake.get_score(), nmoves, env.scenari if done else LIMIT, epsilon, q_delta)
+            epsilon *= epsilon_decay
+            episodes_done = episode + 1
+            checkpointer.step(episodes_done, q_table, epsilon, rng)
+
+            if ui_flag and input_type == "quit":
+                break
 
-            state = state_to_index(snake)
-            action = int(choose_action(q_table, state, epsilon))
-
-            action_type = "dir" if model_name == "v3" else "turn"
-            apply_action(snake, action_type, action)
+    checkpointer.save(episodes_done, q_table, epsilon, rng)
+    checkpointer.wait()
+    if learner:
+        learner.learn()
+    metrics.close()
+    print_learning_progress(q_table, verbose = "full")
+    save_model(model_name, q_table, precision)
 
-            result, scenari = snake.move()
-            q_table[state, action] += update_q_table(q_table, state, action, result, scenari, snake, alpha, gamma)
+    if ui_flag:
+        ui.quit()
 
-            nmoves += 1
+def train_batch(q_table, model_name, print_learning_progress, nbatch, seed=None, resume=False, metrics_file=None, replay_size=0,
+                num_episodes=2000, board_size=BOARD_SIZE, precision="float32"):
+    """Same training as train, but nbatch games are stepped together by a SnakeBatch.
 
-        score = snake.get_score()
-        logging.info(f"Episode: {episode} Score: {score} Epsilon: {epsilon:.4f}")
-        epsilon *= epsilon_decay
+    On Ctrl-C, training stops once a game ends: the games still in progress
+    are dropped, so a resumed run only approximates an uninterrupted one."""
+    gamma = 0.9
+    alpha = 0.1
+    epsilon = 1.0
+    epsilon_decay = 0.99
 
-        if ui_flag and input_type == "quit":
-            break
+    strategy_module = import_module(f"{model_name}.strategy")
+    action_type = "dir" if model_name == "v3" else "turn"
+    rng = np.random.default_rng(seed)
+    learner = ReplayLearner(q_table, alpha, gamma, replay_size, seed=rng.integers(2**63)) if replay_size else None
+    parts = [learner] if learner else []
+    checkpoint_file = os.path.join(model_name, "checkpoint.npz")
+    episode = 0
+    if resume:
+        episode, epsilon = restore_checkpoint(checkpoint_file, q_table, rng, parts)
+    checkpointer = Checkpointer(checkpoint_file, first_episode=episode, parts=parts)
+    metrics = MetricsWriter(metrics_file)
+    batch = SnakeBatch(nbatch, board_size, seed=rng.integers(2**63))
+    state_to_index = instrument.wrap("state", strategy_module.batch_state_to_index)
+    move = instrument.wrap("move", batch.step)
+    update = instrument.wrap("q_update", batch_q_update)
+
+    states = state_to_index(batch)
+    with StopRequest() as stop:
+        while episode < num_episodes:
+            actions = batch_choose_action(q_table, states, epsilon, rng)
+            result, scenari, done = move(actions, action_type)
+            rewards = strategy_module.batch_reward(batch, result, scenari)
+            next_states = state_to_index(batch)
+            if learner:
+                learner.add_batch(states, actions, rewards, next_states, result)
+            else:
+                update(q_table, states, actions, rewards, next_states, result, alpha, gamma)
+
+            ended = done | (batch.moves >= 1000)
+            if ended.any():
+                deaths = np.where(done, scenari.astype(np.int8), LIMIT)[ended]
+                for score, nmoves, death in zip(batch.get_score()[ended], batch.moves[ended], deaths):
+                    metrics.record(episode, score, nmoves, death, epsilon)
+                    episode += 1
+                    epsilon *= epsilon_decay
+                batch.reset(ended)
+                next_states = state_to_index(batch)
+                checkpointer.step(episode, q_table, epsilon, rng)
+                if stop.requested:
+                    logging.warning(f"Interrupted after {episode} episodes")
+                    break
+            states = next_states
 
+    checkpointer.save(episode, q_table, epsilon, rng)
+    checkpointer.wait()
+    if learner:
+        learner.learn()
+    metrics.close()
     print_learning_progress(q_table, verbose = "full")
-    np.save(f"{model_name}/Q_table.npy", q_table)
+    save_model(model_name, q_table, precision)
 
-    if ui_flag:
-        ui.quit()
-
-def test(ui_flag, q_table, state_to_index, ngames, save, print_Q_table_entry, model_name, console_mode):
+def test(ui_flag, q_table, state_to_index, ngames, save, print_Q_table_entry, model_name, console_mode, seed=None, spectator=None, metrics_file=None,
+         board_size=BOARD_SIZE):
     scores = []
+    metrics = MetricsWriter(metrics_file, window=ngames, report_every=0)
+    state_to_index = instrument.wrap("state", state_to_index)
+    move = instrument.wrap("move", Snake.move)
 
     if ui_flag:
-        ui = UI()
+        ui = UI(board_size=board_size)
+        render = instrument.wrap("render", ui.render)
 
     if save:
         if os.path.exists("replays"):
@@ -130,15 +243,22 @@ def test(ui_flag, q_table, state_to_index, ngames, save, print_Q_table_entry, mo
         os.makedirs("replays", exist_ok=True)
 
     for episode in range(ngames):
-        snake = Snake(console=console_mode)
+        if spectator:
+            if spectator.stopped.is_set():
+                break
+            spectator.start_episode(episode)
+        snake = Snake(board_size=board_size, console=console_mode, history_mode="off", seed=None if seed is None else game_seed(seed, episode))
+        if save:
+            writer = ReplayWriter(f"replays/game_{episode}.replay", snake)
         nmoves = 0
         result = True
+        loop = LoopDetector()
 
         while result and nmoves < 100000:
             state = state_to_index(snake)
             # print_Q_table_entry(q_table, state)
             if ui_flag:
-                ui.render(snake)
+                render(snake)
                 input_type, _ = ui.get_spectator_input()
 
                 if input_type == "quit":
@@ -150,36 +270,48 @@ def test(ui_flag, q_table, state_to_index, ngames, save, print_Q_table_entry, mo
             action_type = "dir" if model_name == "v3" else "turn"
             apply_action(snake, action_type, action)
 
-            result, scenari = snake.move()
+            result, scenari = move(snake)
+            if save:
+                writer.record(snake)
+            if spectator:
+                spectator.publish(snake)
+                if spectator.stopped.is_set():
+                    break
 
             nmoves += 1
+            if result and loop.check(snake, scenari in ("green", "red")):
+                scenari = "loop"
+                break
 
         logging.info(f'Episode: {episode} Score: {snake.get_score()} Death: {scenari}')
         scores.append(snake.get_score())
+        metrics.record(episode, snake.get_score(), nmoves, DEATH_CODES[scenari] if not result or scenari == "loop" else LIMIT)
 
         if save:
-            snake.save_game(f"replays/game_{episode}.json")
+            writer.close()
 
         if ui_flag and input_type == "quit":
             break
 
-    logging.info(f'Average score: {sum(scores) / ngames}')
+    if scores:
+        logging.info(f'Average score: {sum(scores) / len(scores)}')
+        metrics.report()
+    metrics.close()
 
     if ui_flag:
         ui.quit()
 
 def replay(ui_flag, filename, q_table, state_to_index, print_Q_table_entry):
-    with open(filename) as f:
-        history = json.load(f)
+    reader = open_game(filename)
 
     if ui_flag:
-        ui = UI()
+        ui = UI(board_size=reader.board_size)
 
     h_idx = 0
-    snake = Snake(state=history[h_idx])
     running = True
 
     while running:
+        snake = reader.seek(h_idx)
         index = state_to_index(snake)
         print_Q_table_entry(q_table, index)
         if ui_flag:
@@ -192,12 +324,11 @@ def replay(ui_flag, filename, q_table, state_to_index, print_Q_table_entry):
                 h_idx = max(0, h_idx + value)
 
         h_idx += 1
-        if h_idx < len(history):
-            snake = Snake(state=history[h_idx])
-        else:
+        if h_idx >= len(reader):
             logging.info("Game Over")
             running = False
 
+    reader.close()
     if ui_flag:
         ui.quit()
 
@@ -207,15 +338,39 @@ if __name__ == "__main__":
     subparsers = parser.add_subparsers(dest="command", help="Commande à exécuter")
 
     play_parser = subparsers.add_parser("play", help="Jouer au jeu")
+    play_parser.add_argument("--board-size", default=BOARD_SIZE, type=int, help="Taille du plateau (nombre de cases par côté)")
 
     replay_parser = subparsers.add_parser("replay", help="Rejouer une partie")
     replay_parser.add_argument("filename", help="Fichier de replay")
     replay_parser.add_argument("--model", default=DEFAULT, help="Modèle d'IA")
     replay_parser.add_argument("--no-ui", action="store_true", help="Mode console")
 
+    export_parser = subparsers.add_parser("export", help="Exporter des parties en GIF ou en images (sans fenêtre)")
+    export_parser.add_argument("filenames", nargs="*", help="Parties à exporter (par défaut toutes celles de replays/)")
+    export_parser.add_argument("--output", default="exports", help="Dossier de sortie")
+    export_parser.add_argument("--format", default="gif", choices=FORMATS, help="GIF animé ou une image PNG par coup")
+    export_parser.add_argument("--fps", default=10, type=int, help="Images par seconde du GIF")
+    export_parser.add_argument("--every", default=1, type=int, help="Garder un coup sur N")
+    export_parser.add_argument("--workers", default=1, type=int, help="Nombre de processus")
+
     train_parser = subparsers.add_parser("train", help="Entraîner un modèle d'IA")
     train_parser.add_argument("--model", default=DEFAULT, help="Nom du modèle")
     train_parser.add_argument("--no-ui", action="store_true", help="Mode console")
+    train_parser.add_argument("--batch", default=0, type=int, help="Nombre de parties jouées en parallèle (sans UI)")
+    train_parser.add_argument("--seed", default=None, type=int, help="Graine aléatoire (entraînement reproductible)")
+    train_parser.add_argument("--workers", default=0, type=int, help="Nombre de processus mettant à jour la Q-table partagée (sans UI)")
+    train_parser.add_argument("--profile", action="store_true", help="Afficher le temps passé dans chaque phase")
+    train_parser.add_argument("--trace", default=None, metavar="FILE", help="Écrire un échantillon des coups et des états dans FILE (JSON lines, implique --profile)")
+    train_parser.add_argument("--spectate", action="store_true", help="Regarder l'entraînement sans le ralentir (F : suivre une partie)")
+    train_parser.add_argument("--resume", action="store_true", help="Reprendre depuis le dernier checkpoint du modèle (avec --batch, les parties en cours à l'interruption sont perdues)")
+    train_parser.add_argument("--metrics", default=None, help="Fichier des métriques par épisode (.csv, sinon dossier de blocs .npy)")
+    train_parser.add_argument("--episodes", default=2000, type=int, help="Nombre d'épisodes d'entraînement")
+    train_parser.add_argument("--plan", default=0, type=int, help="Itérations de planification (Dyna-Q) sur le modèle appris après chaque épisode (sans --batch ni --workers)")
+    train_parser.add_argument("--replay", default=0, type=int, help="Taille du tampon de transitions rejouées par lots (0 : mise à jour à chaque coup)")
+    train_parser.add_argument("--board-size", default=BOARD_SIZE, type=int, help="Taille du plateau (nombre de cases par côté)")
+    train_parser.add_argument("--q-store", default="dense", choices=STORES, help="Q-table dense (tableau) ou creuse (seuls les états visités)")
+    train_parser.add_argument("--precision", default="float32", choices=PRECISIONS, help="Précision de la Q-table enregistrée (int16 : quantifiée avec un facteur d'échelle)")
+    train_parser.add_argument("--max-states", default=None, type=int, help="Nombre maximal d'états d'une Q-table creuse (les moins récents sont oubliés)")
 
     test_parser = subparsers.add_parser("test", help="Tester un modèle d'IA")
     test_parser.add_argument("--model", default=DEFAULT, help="Nom du modèle")
@@ -223,6 +378,13 @@ if __name__ == "__main__":
     test_parser.add_argument("--no-ui", action="store_true", help="Mode console")
     test_parser.add_argument("--save", action="store_true", help="Sauvegarder les parties")
     test_parser.add_argument("--console", action="store_true", help="Afficher la vision dans la console")
+    test_parser.add_argument("--seed", default=None, type=int, help="Graine aléatoire (parties reproductibles)")
+    test_parser.add_argument("--workers", default=0, type=int, help="Nombre de processus (sans UI)")
+    test_parser.add_argument("--profile", action="store_true", help="Afficher le temps passé dans chaque phase")
+    test_parser.add_argument("--trace", default=None, metavar="FILE", help="Écrire un échantillon des coups et des états dans FILE (JSON lines, implique --profile)")
+    test_parser.add_argument("--spectate", action="store_true", help="Regarder les parties sans les ralentir (F : suivre une partie)")
+    test_parser.add_argument("--metrics", default=None, help="Fichier des métriques par partie (.csv, sinon dossier de blocs .npy)")
+    test_parser.add_argument("--board-size", default=BOARD_SIZE, type=int, help="Taille du plateau (nombre de cases par côté)")
 
     visualize_parser = subparsers.add_parser("visualize", help="Visualiser un modèle d'IA")
     visualize_parser.add_argument("--model", default=DEFAULT, help="Nom du modèle")
@@ -230,17 +392,79 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     MODE = args.command
+    trace_file = getattr(args, "trace", None)
+    profile = getattr(args, "profile", False) or trace_file
+    if profile:
+        instrument.enable()
+
+    board_size = getattr(args, "board_size", None)
+    if board_size is not None and board_size < 3:
+        parser.error("La taille du plateau doit être d'au moins 3")
 
     if MODE == "play":
-        play()
+        play(board_size)
+    elif MODE == "export":
+        filenames = args.filenames or find_games()
+        if not filenames:
+            parser.error("Aucune partie à exporter")
+        export(filenames, args.output, args.format, args.fps, args.every, args.workers)
     else:
-        q_table, state_to_index, update_q_table, print_Q_table_entry, print_learning_progress = load(args.model, MODE == "train")
+        store = getattr(args, "q_store", "dense")
+        if store == "sparse" and (args.workers or args.batch or args.replay or args.plan):
+            parser.error("Une Q-table creuse n'est pas disponible avec --workers, --batch, --replay ni --plan")
+        try:
+            q_table, state_to_index, print_Q_table_entry, print_learning_progress = load(
+                args.model, MODE == "train", board_size, store, getattr(args, "max_states", None))
+        except ValueError as e:
+            parser.error(str(e))
+        if MODE == "train" and args.resume:
+            try:
+                check_checkpoint(os.path.join(args.model, "checkpoint.npz"), q_table)
+            except ValueError as e:
+                parser.error(str(e))
+        if MODE == "test" and args.workers and isinstance(q_table, SparseQTable):
+            parser.error("--workers nécessite une Q-table dense")
         if MODE == "replay":
             replay(not args.no_ui, args.filename, q_table, state_to_index, print_Q_table_entry)
-        if MODE == "train":
-            train(not args.no_ui, q_table, state_to_index, update_q_table, args.model, print_learning_progress)
-        if MODE == "test":
-            test(not args.no_ui, q_table, state_to_index, args.games, args.save, print_Q_table_entry, args.model, args.console)
+        if MODE == "train" and args.workers:
+            if args.resume:
+                parser.error("--resume n'est pas disponible avec --workers")
+            if args.replay:
+                parser.error("--replay n'est pas disponible avec --workers")
+        if MODE == "train" and args.plan and (args.workers or args.batch):
+            parser.error("--plan n'est pas disponible avec --workers ni --batch")
+        if MODE == "train" and args.plan and model_bytes(*q_table.shape) > MAX_MODEL_BYTES:
+            parser.error(f"--plan nécessiterait {model_bytes(*q_table.shape) / 2**20:.0f} Mo pour {q_table.shape[0]} états "
+                         f"(maximum {MAX_MODEL_BYTES / 2**20:.0f} Mo)")
+        if MODE == "train" and args.workers:
+            train_parallel(q_table, args.model, print_learning_progress, args.workers, args.seed, metrics_file=args.metrics,
+                           num_episodes=args.episodes, board_size=board_size, precision=args.precision)
+        elif MODE == "train" and args.batch:
+            train_batch(q_table, args.model, print_learning_progress, args.batch, args.seed, args.resume, args.metrics, args.replay,
+                        num_episodes=args.episodes, board_size=board_size, precision=args.precision)
+        elif MODE == "train" and args.spectate:
+            Spectator().run(train, False, q_table, args.model, print_learning_progress, args.seed, resume=args.resume, metrics_file=args.metrics,
+                            replay_size=args.replay, num_episodes=args.episodes, plan_sweeps=args.plan, board_size=board_size,
+                            precision=args.precision)
+        elif MODE == "train":
+            train(not args.no_ui, q_table, args.model, print_learning_progress, args.seed, resume=args.resume, metrics_file=args.metrics,
+                  replay_size=args.replay, num_episodes=args.episodes, plan_sweeps=args.plan, board_size=board_size,
+                  precision=args.precision)
+        if MODE == "test" and args.workers:
+            if args.save:
+                shutil.rmtree("replays", ignore_errors=True)
+            evaluate(args.model, q_table, args.games, args.workers, "replays" if args.save else None, args.seed, args.metrics, board_size)
+        elif MODE == "test" and args.spectate:
+            Spectator().run(test, False, q_table, state_to_index, args.games, args.save, print_Q_table_entry, args.model, args.console, args.seed,
+                            metrics_file=args.metrics, board_size=board_size)
+        elif MODE == "test":
+            test(not args.no_ui, q_table, state_to_index, args.games, args.save, print_Q_table_entry, args.model, args.console, args.seed,
+                 metrics_file=args.metrics, board_size=board_size)
         if MODE == "visualize":
             print_learning_progress(q_table, verbose="medium")
+        if profile:
+            instrument.report()
+        if trace_file:
+            instrument.dump_traces(trace_file)
+            logging.info(f"Traces written to {trace_file}")
 
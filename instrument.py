@@ -0,0 +1,89 @@
+"""Opt-in instrumentation of the simulation hot path.
+
+Everything is off by default. Call sites guard their hooks with the module
+flag, so a disabled hook costs a single attribute lookup:
+
+    if instrument.enabled:
+        instrument.count("green")
+
+Phase timers are installed by wrapping functions once, at setup time:
+wrap() returns the function itself when instrumentation is disabled.
+"""
+import json
+from collections import Counter, defaultdict, deque
+from time import perf_counter
+from logger import logger as logging
+
+enabled = False
+trace_every = 1000
+
+timers = defaultdict(float)
+calls = Counter()
+counters = Counter()
+traces = deque(maxlen=10000)
+_trace_calls = Counter()
+
+
+def enable(every=1000):
+    """Turns instrumentation on; one trace out of `every` is kept for each kind."""
+    global enabled, trace_every
+    enabled = True
+    trace_every = every
+    reset()
+
+
+def reset():
+    timers.clear()
+    calls.clear()
+    counters.clear()
+    traces.clear()
+    _trace_calls.clear()
+
+
+def wrap(phase, function):
+    """Returns function, timed under phase when instrumentation is enabled."""
+    if not enabled:
+        return function
+
+    def timed(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timers[phase] += perf_counter() - start
+            calls[phase] += 1
+    return timed
+
+
+def count(event, n=1):
+    counters[event] += n
+
+
+def trace(kind, **fields):
+    """Keeps one trace out of trace_every for this kind."""
+    _trace_calls[kind] += 1
+    if _trace_calls[kind] % trace_every == 1 or trace_every == 1:
+        fields["kind"] = kind
+        fields["n"] = _trace_calls[kind]
+        traces.append(fields)
+
+
+def dump_traces(filename):
+    """Writes the kept traces to filename, one JSON object per line."""
+    with open(filename, "w") as f:
+        for record in traces:
+            f.write(json.dumps(record) + "\n")
+
+
+def report():
+    """Logs the time spent in each phase and the event counters."""
+    total = sum(timers.values())
+    logging.info("Time per phase:")
+    for phase, seconds in sorted(timers.items(), key=lambda item: -item[1]):
+        share = seconds / total * 100 if total else 0
+        per_call = seconds / calls[phase] * 1e6
+        logging.info(f"  {phase:<12} {seconds:8.3f} s {share:5.1f} % {calls[phase]:>10} calls {per_call:8.2f} us/call")
+    if counters:
+        logging.info("Events: " + ", ".join(f"{event}: {n}" for event, n in counters.most_common()))
+    if traces:
+        logging.info(f"Traces kept: {len(traces)}")
@@ -0,0 +1,119 @@
+import os
+import glob
+import time
+from collections import Counter
+import numpy as np
+from snake import TILE_NAMES
+from logger import logger as logging
+
+# One record per episode. death is the tile code of the fatal move, LIMIT when
+# the episode was cut by the move limit and LOOP when it was stopped because
+# it repeated itself. q_delta is the sum of the absolute changes of the
+# Q-table during the episode (nan when not measured).
+LIMIT = -1
+LOOP = -2
+DEATH_NAMES = {code: name for code, name in enumerate(TILE_NAMES)}
+DEATH_NAMES[LIMIT] = "move limit"
+DEATH_NAMES[LOOP] = "loop"
+DEATH_CODES = {name: code for code, name in DEATH_NAMES.items()}
+
+RECORD = np.dtype([
+    ("episode", "i8"),
+    ("score", "i4"),
+    ("moves", "i4"),
+    ("death", "i1"),
+    ("epsilon", "f8"),
+    ("time", "f8"),
+    ("q_delta", "f8"),
+])
+
+
+class MetricsWriter:
+    """Per-episode metrics, buffered in a preallocated array and flushed by blocks.
+
+    filename ending with .csv is appended as CSV, any other name is a
+    directory of .npy chunks (one per block). Without filename, nothing is
+    written but the rolling statistics are still reported: every report_every
+    episodes, the mean and percentiles of the last `window` scores are logged."""
+
+    def __init__(self, filename=None, block_size=1024, window=100, report_every=100):
+        self.filename = filename
+        self.buffer = np.zeros(block_size, dtype=RECORD)
+        self.size = 0
+        self.chunks = 0
+        self.scores = np.zeros(window, dtype=np.int32)
+        self.count = 0
+        self.report_every = report_every
+        self.start = time.perf_counter()
+        self.deaths = Counter()
+
+        if filename and filename.endswith(".csv"):
+            if not os.path.exists(filename):
+                with open(filename, "w") as f:
+                    f.write(",".join(RECORD.names) + "\n")
+        elif filename:
+            os.makedirs(filename, exist_ok=True)
+            self.chunks = len(glob.glob(os.path.join(filename, "chunk_*.npy")))
+
+    def record(self, episode, score, moves, death=LIMIT, epsilon=np.nan, q_delta=np.nan):
+        self.buffer[self.size] = (episode, score, moves, death, epsilon, time.perf_counter() - self.start, q_delta)
+        self.size += 1
+        self.scores[self.count % len(self.scores)] = score
+        self.count += 1
+        self.deaths[int(death)] += 1
+        if self.size == len(self.buffer):
+            self.flush()
+        if self.report_every and self.count % self.report_every == 0:
+            self.report()
+
+    def flush(self):
+        if self.filename and self.size:
+            block = self.buffer[:self.size]
+            if self.filename.endswith(".csv"):
+                with open(self.filename, "a") as f:
+                    np.savetxt(f, block, delimiter=",", fmt=["%d", "%d", "%d", "%d", "%.6g", "%.3f", "%.6g"])
+            else:
+                np.save(os.path.join(self.filename, f"chunk_{self.chunks:05d}.npy"), block)
+                self.chunks += 1
+        self.size = 0
+
+    def rolling(self):
+        """(mean, median, 90th percentile, max) of the last scores."""
+        scores = self.scores[:min(self.count, len(self.scores))]
+        if not len(scores):
+            return 0.0, 0.0, 0.0, 0
+        p50, p90 = np.percentile(scores, [50, 90])
+        return scores.mean(), p50, p90, scores.max()
+
+    def report(self):
+        mean, p50, p90, best = self.rolling()
+        window = min(self.count, len(self.scores))
+        elapsed = time.perf_counter() - self.start
+        logging.info(f"Episodes: {self.count} Last {window}: mean {mean:.2f} p50 {p50:.0f} p90 {p90:.0f} max {best} "
+                     f"({self.count / elapsed:.1f} episodes/s)")
+
+    def close(self):
+        """Flushes the last block and logs the deaths of the whole run."""
+        self.flush()
+        if self.count:
+            logging.info("Deaths: " + ", ".join(f"{DEATH_NAMES[code]}: {n}" for code, n in self.deaths.most_common()))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_metrics(filename):
+    """Records written by a MetricsWriter, as a structured array."""
+    if filename.endswith(".csv"):
+        data = np.loadtxt(filename, delimiter=",", skiprows=1, ndmin=2)
+        records = np.zeros(len(data), dtype=RECORD)
+        for i, name in enumerate(RECORD.names):
+            records[name] = data[:, i]
+        return records
+    chunks = sorted(glob.glob(os.path.join(filename, "chunk_*.npy")))
+    if not chunks:
+        return np.zeros(0, dtype=RECORD)
+    return np.concatenate([np.load(chunk) for chunk in chunks])
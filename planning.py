@@ -0,0 +1,59 @@
+import numpy as np
+from logger import logger as logging
+
+# The transition counts are dense, quadratic in the number of states:
+# --plan is refused when they would take more memory than this.
+MAX_MODEL_BYTES = 2**28
+
+
+def model_bytes(nstates, nactions):
+    """Memory taken by the arrays of a PlanningModel."""
+    return 8 * nstates * nactions * (nstates + 2)
+
+
+class PlanningModel:
+    """Dyna-Q model of a tabular strategy, learned from the real moves.
+
+    counts[state, action, next_state] counts the observed transitions, the
+    last next state standing for the end of the game, and reward_sums the
+    rewards received. plan() runs value iteration on this empirical model,
+    so that the Q-table converges from far fewer simulated moves. Its size is
+    quadratic in the number of states (see model_bytes)."""
+
+    def __init__(self, nstates, nactions):
+        self.counts = np.zeros((nstates, nactions, nstates + 1), dtype=np.int64)
+        self.reward_sums = np.zeros((nstates, nactions))
+        self.terminal = nstates
+
+    def record(self, state, action, reward, next_state):
+        """Adds one real transition, next_state is None for a terminal move."""
+        self.counts[state, action, self.terminal if next_state is None else next_state] += 1
+        self.reward_sums[state, action] += reward
+
+    def plan(self, q_table, gamma, sweeps=10):
+        """Replaces the tried entries of q_table by sweeps backups of the model.
+
+        Untried actions keep their value and are left out of the maximum, so
+        choose_action still tries them first."""
+        visits = self.counts.sum(axis=2)
+        tried = visits > 0
+        if not tried.any():
+            return
+        probabilities = self.counts[tried] / visits[tried][:, None]
+        rewards = self.reward_sums[tried] / visits[tried]
+        known = tried.any(axis=1)
+        values = np.zeros(self.terminal + 1)
+        for _ in range(sweeps):
+            values[:-1][known] = np.where(tried, q_table, -np.inf)[known].max(axis=1)
+            q_table[tried] = rewards + gamma * (probabilities @ values)
+
+    def checkpoint_arrays(self):
+        """Copy of the model, saved with the training checkpoints."""
+        return {"model_counts": self.counts.copy(), "model_reward_sums": self.reward_sums.copy()}
+
+    def restore_arrays(self, arrays):
+        if "model_counts" not in arrays:
+            logging.warning("No planning model in the checkpoint, starting with an empty one")
+            return
+        self.counts[...] = arrays["model_counts"]
+        self.reward_sums[...] = arrays["model_reward_sums"]
@@ -0,0 +1,42 @@
+import random
+import numpy as np
+
+
+def choose_action(q_table, state, epsilon, rng=random):
+    if rng.uniform(0, 1) < epsilon:
+        return rng.randint(0, 2)
+    else:
+        for i in range(len(q_table[state])):
+            if q_table[state][i] == 0:
+                return i
+        return np.argmax(q_table[state])
+
+def batch_choose_action(q_table, states, epsilon, rng):
+    """choose_action for a vector of states."""
+    rows = q_table[states]
+    untried = rows == 0
+    actions = np.where(untried.any(axis=1), np.argmax(untried, axis=1), np.argmax(rows, axis=1))
+    explore = rng.random(len(states)) < epsilon
+    actions[explore] = rng.integers(q_table.shape[1], size=np.count_nonzero(explore))
+    return actions
+
+def q_update(q_table, state, action, reward, next_state, alpha, gamma):
+    """Q-learning update of one transition, next_state is None for a terminal move."""
+    target = reward if next_state is None else reward + gamma * np.max(q_table[next_state])
+    q_table[state, action] += alpha * (target - q_table[state, action])
+
+def batch_q_update(q_table, states, actions, rewards, next_states, alive, alpha, gamma):
+    """q_update for a vector of transitions, alive is False for terminal moves."""
+    target = rewards + gamma * np.max(q_table[next_states], axis=1) * alive
+    np.add.at(q_table, (states, actions), alpha * (target - q_table[states, actions]))
+
+def mean_q_update(q_table, states, actions, rewards, next_states, alive, alpha, gamma):
+    """batch_q_update where an entry sampled several times moves by alpha times its mean error.
+
+    Large batches over small tables repeat entries many times: summing
+    their updates would make steps far larger than alpha and diverge."""
+    target = rewards + gamma * np.max(q_table[next_states], axis=1) * alive
+    entries = states * q_table.shape[1] + actions
+    errors = np.bincount(entries, target - q_table[states, actions], q_table.size)
+    counts = np.bincount(entries, minlength=q_table.size)
+    q_table += (alpha * errors / np.maximum(counts, 1)).reshape(q_table.shape)
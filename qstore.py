@@ -0,0 +1,201 @@
+import os
+import json
+from collections import OrderedDict
+import numpy as np
+
+# A Q-store maps a state index to its row of action values. The dense
+# backend is a plain NumPy array of shape (nstates, nactions); the sparse
+# one is a SparseQTable. Both support q_table[state] (the action row),
+# q_table[state, action] = value, len() and shape, which is all the
+# per-move training path (choose_action, q_update, the strategies) uses.
+STORES = ["dense", "sparse"]
+
+# Precisions of the saved dense models. int16 values are stored divided by a
+# scale factor, kept in the Q_table.json file next to the Q_table.npy.
+PRECISIONS = ["float64", "float32", "int16"]
+INT16_MAX = np.iinfo(np.int16).max
+
+
+class SparseQTable:
+    """Hash map from state index to a float32 action row, for state spaces too
+    large to allocate.
+
+    Only the states that were updated are stored: reading another state
+    gives a read-only row of zeros. With max_states, the least recently used
+    state is evicted when a new one would exceed it, forgetting its values."""
+
+    def __init__(self, nstates, nactions, max_states=None, dtype=np.float32):
+        self.shape = (nstates, nactions)
+        self.dtype = np.dtype(dtype)
+        self.max_states = max_states
+        self.rows = OrderedDict()
+        self.evictions = 0
+        self._zeros = np.zeros(nactions, dtype=self.dtype)
+        self._zeros.flags.writeable = False
+
+    def __len__(self):
+        return self.shape[0]
+
+    def _row(self, state, create=False):
+        if not 0 <= state < self.shape[0]:
+            raise IndexError(f"state {state} out of range for {self.shape[0]} states")
+        rows = self.rows
+        row = rows.get(state)
+        if row is not None:
+            rows.move_to_end(state)
+            return row
+        if not create:
+            return self._zeros
+        row = rows[state] = np.zeros(self.shape[1], dtype=self.dtype)
+        if self.max_states and len(rows) > self.max_states:
+            rows.popitem(last=False)
+            self.evictions += 1
+        return row
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            state, action = key
+            return self._row(state)[action]
+        return self._row(key)
+
+    def __setitem__(self, key, value):
+        if isinstance(key, tuple):
+            state, action = key
+            self._row(state, create=True)[action] = value
+        else:
+            self._row(key, create=True)[...] = value
+
+    def copy(self):
+        table = SparseQTable(*self.shape, self.max_states, self.dtype)
+        table.rows = OrderedDict((state, row.copy()) for state, row in self.rows.items())
+        return table
+
+    def to_arrays(self):
+        """(states, rows) of the stored states, least recently used first."""
+        states = np.fromiter(self.rows.keys(), dtype=np.int64, count=len(self.rows))
+        rows = np.array(list(self.rows.values()), dtype=self.dtype).reshape(len(states), self.shape[1])
+        return states, rows
+
+    @classmethod
+    def from_arrays(cls, nstates, states, rows, max_states=None):
+        table = cls(nstates, rows.shape[1], max_states, rows.dtype)
+        for state, row in zip(states.tolist(), rows):
+            table.rows[state] = row.copy()
+        return table
+
+
+class QuantizedQTable:
+    """Saved int16 Q-table and its scale factor, dequantized row by row when read.
+
+    The scale is positive, so the greedy action of a quantized row is the one
+    of the original row (up to rounding)."""
+
+    def __init__(self, data, scale):
+        self.data = data
+        self.scale = scale
+        self.shape = data.shape
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, key):
+        return self.data[key] * self.scale
+
+
+def quantize(q_table):
+    """(int16 array, scale) approximating q_table as array * scale.
+
+    Non-zero values smaller than the scale are kept at ±1: choose_action
+    treats a zero as an untried action."""
+    q_table = np.asarray(q_table)
+    peak = float(np.max(np.abs(q_table))) if q_table.size else 0.0
+    scale = peak / INT16_MAX if peak else 1.0
+    data = np.round(q_table / scale).astype(np.int16)
+    return np.where((q_table != 0) & (data == 0), np.sign(q_table), data).astype(np.int16), scale
+
+
+def is_dense(q_table):
+    return isinstance(q_table, np.ndarray)
+
+
+def copy_table(q_table):
+    return np.array(q_table) if is_dense(q_table) else q_table.copy()
+
+
+def describe(q_table):
+    """Backend and shape of q_table, as shown in error messages."""
+    return f"{'sparse' if isinstance(q_table, SparseQTable) else 'dense'} {tuple(q_table.shape)}"
+
+
+def check_compatible(q_table, other):
+    """Raises ValueError unless other has the backend and shape of q_table."""
+    if describe(q_table) != describe(other):
+        raise ValueError(f"Q-table incompatible : {describe(other)} au lieu de {describe(q_table)}")
+
+
+def assign(q_table, other):
+    """Overwrites the values of q_table with those of other, of the same backend and shape."""
+    check_compatible(q_table, other)
+    if is_dense(q_table):
+        q_table[...] = other
+    else:
+        q_table.rows = other.copy().rows
+
+
+def table_arrays(q_table):
+    """Arrays saving q_table with np.savez (read back by table_from_arrays)."""
+    if is_dense(q_table):
+        return {"q_table": q_table}
+    states, rows = q_table.to_arrays()
+    return {"q_states": states, "q_rows": rows, "q_shape": np.array(q_table.shape)}
+
+
+def table_from_arrays(data, max_states=None):
+    if "q_table" in data:
+        return data["q_table"]
+    return SparseQTable.from_arrays(int(data["q_shape"][0]), data["q_states"], data["q_rows"], max_states)
+
+
+def is_mapped(q_table):
+    """Whether q_table is read from its file through a memory map."""
+    data = q_table.data if isinstance(q_table, QuantizedQTable) else q_table
+    return isinstance(data, np.memmap)
+
+
+def model_filename(model_name, q_table):
+    """File of the saved Q-table of model_name: Q_table.npy when dense, Q_table.npz when sparse."""
+    return os.path.join(model_name, "Q_table.npz" if isinstance(q_table, SparseQTable) else "Q_table.npy")
+
+
+def save_q_table(f, q_table, precision="float64"):
+    """Writes q_table to f, a dense table converted to precision.
+
+    Returns the scale factor of an int16 table, None otherwise."""
+    if not is_dense(q_table):
+        np.savez(f, **table_arrays(q_table))
+        return None
+    if precision not in PRECISIONS:
+        raise ValueError(f"Précision invalide : {precision}")
+    if precision == "int16":
+        data, scale = quantize(q_table)
+        np.save(f, data)
+        return scale
+    np.save(f, q_table.astype(precision, copy=False))
+    return None
+
+
+def load_q_table(model_name, max_states=None, mmap=True):
+    """Saved Q-table of model_name, sparse if it was saved as such.
+
+    A dense table is memory-mapped read-only by default: loading does not
+    depend on its size, and every process reading it shares the page cache."""
+    sparse_file = os.path.join(model_name, "Q_table.npz")
+    if os.path.exists(sparse_file):
+        with np.load(sparse_file) as data:
+            return table_from_arrays(data, max_states)
+    q_table = np.load(os.path.join(model_name, "Q_table.npy"), mmap_mode="r" if mmap else None)
+    scale_file = os.path.join(model_name, "Q_table.json")
+    if os.path.exists(scale_file):
+        with open(scale_file) as f:
+            q_table = QuantizedQTable(q_table, json.load(f)["scale"])
+    return q_table
@@ -0,0 +1,233 @@
+import mmap
+import struct
+from array import array
+from snake import Snake, load_history, read_history
+
+# Binary replay layout (little endian):
+#   header: magic, version, flags, board size, seed
+#   initial state: dir, body length, body cells, green apple cells, red apple cells
+#   moves: one byte per move (dir | spawn count << 2), followed by the spawned cells
+# Cells are stored as row * board_size + col on 2 bytes. When the game was
+# seeded (FLAG_SEED), spawns are not stored: replaying the moves on a Snake
+# created with the same seed draws the same apples.
+MAGIC = b"L2SR"
+VERSION = 1
+FLAG_SEED = 1
+
+HEADER = struct.Struct("<4sBBHQ")
+CELL = struct.Struct("<H")
+
+
+class ReplayWriter:
+    """Streams the moves of a game to a binary replay file while it is played.
+
+    It must be created before the first move of snake."""
+
+    def __init__(self, filename, snake):
+        self.board_size = snake.board_size
+        self.seeded = snake.seed is not None
+        self.file = open(filename, "wb", buffering=1 << 16)
+        flags = FLAG_SEED if self.seeded else 0
+        self.file.write(HEADER.pack(MAGIC, VERSION, flags, snake.board_size, snake.seed or 0))
+
+        state = snake._get_state()
+        self.file.write(struct.pack("<BI", state["dir"], len(state["positions"])))
+        self._write_cells(state["positions"])
+        for apples in (state["green_apples"], state["red_apples"]):
+            self.file.write(struct.pack("<B", len(apples)))
+            self._write_cells(apples)
+
+    def _write_cells(self, positions):
+        self.file.write(b"".join(CELL.pack(p[0] * self.board_size + p[1]) for p in positions))
+
+    def record(self, snake):
+        """Appends the last move of snake."""
+        spawns = [] if self.seeded else snake.last_spawns
+        self.file.write(bytes((snake.dir | len(spawns) << 2,)))
+        if spawns:
+            self._write_cells(spawns)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def is_replay(filename):
+    with open(filename, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_header(data):
+    """Decodes the header of a replay buffer.
+
+    Returns (header, initial state, offset of the first move)."""
+    magic, version, flags, board_size, seed = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Fichier de replay invalide")
+    offset = HEADER.size
+
+    def cells(count):
+        nonlocal offset
+        values = struct.unpack_from(f"<{count}H", data, offset)
+        offset += 2 * count
+        return [(c // board_size, c % board_size) for c in values]
+
+    dir, length = struct.unpack_from("<BI", data, offset)
+    offset += 5
+    positions = cells(length)
+    apples = []
+    for _ in range(2):
+        count = data[offset]
+        offset += 1
+        apples.append(cells(count))
+
+    header = {
+        "board_size": board_size,
+        "seed": seed if flags & FLAG_SEED else None,
+    }
+    state = {"positions": positions, "dir": dir, "green_apples": apples[0], "red_apples": apples[1]}
+    return header, state, offset
+
+
+def iter_moves(data, offset, board_size):
+    """Yields (dir, spawned cells) for each move stored from offset."""
+    end = len(data)
+    while offset < end:
+        byte = data[offset]
+        count = byte >> 2
+        spawns = struct.unpack_from(f"<{count}H", data, offset + 1)
+        offset += 1 + 2 * count
+        yield byte & 3, [(c // board_size, c % board_size) for c in spawns]
+
+
+class ReplayReader:
+    """Random access to the states of a binary replay.
+
+    The file is memory-mapped and the game is decoded once when opened,
+    indexing the offset of every move and keeping a keyframe (full state)
+    every keyframe_interval moves. Seeking to any move then re-simulates at
+    most keyframe_interval moves from the closest keyframe before it."""
+
+    def __init__(self, filename, keyframe_interval=256):
+        self.file = open(filename, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.header, state, offset = read_header(self.data)
+        self.board_size = self.header["board_size"]
+        self.keyframe_interval = keyframe_interval
+        snake = _initial_snake(self.header, state)
+        self.keyframes = [snake.snapshot()]
+
+        self.offsets = array("Q")
+        data, end = self.data, len(self.data)
+        while offset < end:
+            self.offsets.append(offset)
+            offset += 1 + 2 * (data[offset] >> 2)
+            snake.replay_move(*self._move(len(self.offsets) - 1))
+            if len(self.offsets) % keyframe_interval == 0:
+                self.keyframes.append(snake.snapshot())
+
+        self.snake = None
+        self.index = -1
+
+    def __len__(self):
+        """Number of states, the initial one included."""
+        return len(self.offsets) + 1
+
+    def _move(self, i):
+        offset = self.offsets[i]
+        byte = self.data[offset]
+        count = byte >> 2
+        if self.header["seed"] is not None:
+            return byte & 3, None
+        spawns = struct.unpack_from(f"<{count}H", self.data, offset + 1)
+        return byte & 3, [(c // self.board_size, c % self.board_size) for c in spawns]
+
+    def seek(self, index):
+        """Returns a Snake in the state reached after index moves.
+
+        The same Snake is reused by the next calls, it must not be modified."""
+        index = max(0, min(index, len(self) - 1))
+        keyframe = index // self.keyframe_interval
+        if self.snake is None or index < self.index or keyframe * self.keyframe_interval > self.index:
+            self.snake = Snake(board_size=self.board_size, state=self.keyframes[keyframe]["state"], history_mode="off")
+            self.snake.restore(self.keyframes[keyframe])
+            self.index = keyframe * self.keyframe_interval
+
+        while self.index < index:
+            self.snake.replay_move(*self._move(self.index))
+            self.index += 1
+        return self.snake
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HistoryReader:
+    """Same interface as ReplayReader for the JSON histories written by save_game."""
+
+    def __init__(self, filename):
+        self.board_size, self.history = read_history(filename)
+
+    def __len__(self):
+        return len(self.history)
+
+    def seek(self, index):
+        index = max(0, min(index, len(self) - 1))
+        return Snake(board_size=self.board_size, state=self.history[index], history_mode="off")
+
+    def close(self):
+        pass
+
+
+def open_game(filename):
+    """Reader for a saved game, from a binary replay or a JSON history."""
+    if is_replay(filename):
+        return ReplayReader(filename)
+    return HistoryReader(filename)
+
+
+def _initial_snake(header, state):
+    """Snake in the initial state of a replay, with the game's RNG when it was seeded."""
+    if header["seed"] is None:
+        return Snake(board_size=header["board_size"], state=state, history_mode="off")
+
+    snake = Snake(board_size=header["board_size"], seed=header["seed"], history_mode="off")
+    initial = snake._get_state()
+    if initial["positions"] != state["positions"] or initial["dir"] != state["dir"] \
+            or set(initial["green_apples"]) != set(state["green_apples"]) \
+            or set(initial["red_apples"]) != set(state["red_apples"]):
+        raise ValueError("Le seed du replay ne redonne pas son état initial")
+    return snake
+
+
+def load_replay(filename):
+    """Re-simulates a binary replay and returns its full states, like load_history."""
+    with open(filename, "rb") as f:
+        data = f.read()
+    header, state, offset = read_header(data)
+
+    snake = _initial_snake(header, state)
+    snake.history_mode = "full"
+    snake._save_state()
+    for dir, spawns in iter_moves(data, offset, header["board_size"]):
+        snake.replay_move(dir, spawns if header["seed"] is None else None)
+    return snake.history
+
+
+def load_game(filename):
+    """Full states of a saved game, from a binary replay or a JSON history."""
+    if is_replay(filename):
+        return load_replay(filename)
+    return load_history(filename)
@@ -0,0 +1,69 @@
+import numpy as np
+from multiprocessing import shared_memory
+from queue import Empty
+
+
+class SharedTable:
+    """NumPy array living in a shared memory block.
+
+    The process that creates it owns the block and must unlink() it. Other
+    processes attach() to it by name, through the picklable spec(), and see
+    the same memory instead of a copy."""
+
+    def __init__(self, shm, shape, dtype, owner):
+        self.shm = shm
+        self.owner = owner
+        self.array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    @classmethod
+    def create(cls, array):
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        table = cls(shm, array.shape, array.dtype, owner=True)
+        table.array[...] = array
+        return table
+
+    @classmethod
+    def attach(cls, name, shape, dtype):
+        return cls(shared_memory.SharedMemory(name=name), shape, dtype, owner=False)
+
+    def spec(self):
+        return self.shm.name, self.array.shape, self.array.dtype.str
+
+    def close(self):
+        del self.array
+        self.shm.close()
+
+    def unlink(self):
+        self.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def worker_results(queue, workers, timeout=1.0):
+    """Yields the messages (worker_id, value, ...) put on queue by workers,
+    until each one has put its last message, with value None.
+
+    Raises RuntimeError when a worker dies before its last message, instead
+    of waiting for it forever."""
+    finished = set()
+    while len(finished) < len(workers):
+        try:
+            message = queue.get(timeout=timeout)
+        except Empty:
+            # A worker exiting normally has put its last message in its finally
+            for worker_id, worker in enumerate(workers):
+                if worker_id not in finished and worker.exitcode:
+                    raise RuntimeError(f"Worker {worker_id} died with exit code {worker.exitcode}")
+            continue
+        if message[1] is None:
+            finished.add(message[0])
+        else:
+            yield message
+
+
+def stop_workers(workers):
+    """Terminates the workers still running, after an error."""
+    for worker in workers:
+        if worker.is_alive():
+            worker.terminate()
+            worker.join()
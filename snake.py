@@ -1,6 +1,8 @@
 import json
 import random
-from logger import logger as logging
+from collections import deque
+from functools import lru_cache
+import instrument
 
 BOARD_SIZE = 10
 
@@ -15,53 +17,249 @@ DIRECTIONS = [(-1, 0), (0, 1), (1, 0), (0, -1)]
 TURN_LEFT = [LEFT, UP, RIGHT, DOWN]
 TURN_RIGHT = [RIGHT, DOWN, LEFT, UP]
 
+# Tile codes, as stored in the occupancy grids
+EMPTY = 0
+SNAKE = 1
+GREEN = 2
+RED = 3
+WALL = 4
+TILE_NAMES = ["empty", "snake", "green", "red", "wall"]
+
+# Event code of a move: the tile code entered, plus DEATH when the move ended the game
+DEATH = 5
+N_EVENTS = 10
+
+# History modes:
+# - "full": one full state per move (default)
+# - "ring": full states of the last history_size moves only
+# - "delta": initial state, then the direction and apple spawns of each move
+# - "off": nothing is recorded
+HISTORY_MODES = ["full", "ring", "delta", "off"]
+
+@lru_cache(maxsize=None)
+def ray_slices(board_size):
+    """Rays of every cell, built once per board size.
+
+    ray_slices(n)[row * n + col][dir] is the slice of an occupancy grid
+    holding the cells seen from (row, col) looking in direction dir, nearest
+    first, up to the wall."""
+    rays = []
+    for cell in range(board_size * board_size):
+        row, col = divmod(cell, board_size)
+        up = slice(cell - board_size, None, -board_size) if row > 0 else slice(0, 0)
+        right = slice(cell + 1, (row + 1) * board_size)
+        down = slice(cell + board_size, None, board_size)
+        left = slice(cell - 1, row * board_size - 1 if row > 0 else None, -1) if col > 0 else slice(0, 0)
+        rays.append((up, right, down, left))
+    return rays
+
+@lru_cache(maxsize=None)
+def zobrist_keys(board_size):
+    """Random 64-bit keys of the Zobrist hash of a board size, drawn once.
+
+    Returns (tile_keys, head_keys): tile_keys[code][cell] is the key of the
+    tile code on the cell (0 for EMPTY), head_keys[cell] the key of the head
+    being on the cell."""
+    rng = random.Random(f"zobrist-{board_size}")
+    ncells = board_size * board_size
+    tile_keys = [[0] * ncells] + [[rng.getrandbits(64) for _ in range(ncells)] for _ in (SNAKE, GREEN, RED)]
+    head_keys = [rng.getrandbits(64) for _ in range(ncells)]
+    return tile_keys, head_keys
+
+@lru_cache(maxsize=None)
+def all_cells(board_size):
+    """(row, col) of every cell, in row-major order."""
+    return tuple((row, col) for row in range(board_size) for col in range(board_size))
+
+def game_seed(base_seed, game):
+    """Seed of game number `game` in the stream of base_seed.
+
+    It only depends on the game number, so games can be split across workers
+    in any way and still be played (or replayed) identically."""
+    return ((base_seed & 0xFFFFFFFF) << 32) + game
+
 def direction_after_turn(dir, turn):
     index = TURN_LEFT[dir] if turn == "left" else TURN_RIGHT[dir]
     return index
 
+class FreePositions:
+    """Set of free cells with O(1) add, remove and uniform sampling.
+
+    Cells are kept in a list, and index[row * board_size + col] is their place
+    in it (-1 when the cell is not free). Removing a cell moves the last one
+    into its slot, so the list never has holes."""
+
+    def __init__(self, board_size, positions=()):
+        self.board_size = board_size
+        self.cells = []
+        self.index = [-1] * (board_size * board_size)
+        for pos in positions:
+            self.add(pos)
+
+    @classmethod
+    def full(cls, board_size):
+        """Pool of every cell of the board, in row-major order, built without a loop."""
+        pool = cls(board_size)
+        pool.cells = list(all_cells(board_size))
+        pool.index = list(range(board_size * board_size))
+        return pool
+
+    def add(self, pos):
+        key = pos[0] * self.board_size + pos[1]
+        if self.index[key] < 0:
+            self.index[key] = len(self.cells)
+            self.cells.append(pos)
+
+    def discard(self, pos):
+        key = pos[0] * self.board_size + pos[1]
+        i = self.index[key]
+        if i < 0:
+            return
+        last = self.cells.pop()
+        if i < len(self.cells):
+            self.cells[i] = last
+            self.index[last[0] * self.board_size + last[1]] = i
+        self.index[key] = -1
+
+    def remove(self, pos):
+        if pos not in self:
+            raise KeyError(pos)
+        self.discard(pos)
+
+    def sample(self, rng):
+        return rng.choice(self.cells)
+
+    def copy(self):
+        return set(self.cells)
+
+    def __contains__(self, pos):
+        return 0 <= pos[0] < self.board_size and 0 <= pos[1] < self.board_size \
+            and self.index[pos[0] * self.board_size + pos[1]] >= 0
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __iter__(self):
+        return iter(self.cells)
+
+    def __or__(self, other):
+        return set(self.cells) | set(other)
+
+    __ror__ = __or__
+
+
 # First coordinate is the row, second is the column
 class Snake:
-    def __init__(self, board_size=BOARD_SIZE, initial_length=3, state=None, console=False):
+    def __init__(self, board_size=BOARD_SIZE, initial_length=3, state=None, console=False, history_mode="full", history_size=1000, seed=None):
+        if history_mode not in HISTORY_MODES:
+            raise ValueError(f"Mode d'historique invalide : {history_mode}")
         self.board_size = board_size
-        self.history = []
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.history_mode = history_mode
+        self.history = deque(maxlen=history_size) if history_mode == "ring" else []
+
+        # Apples placed by the last move, and apples to place instead of random ones when replaying
+        self.last_spawns = []
+        self.forced_spawns = None
+
+        # Body as a deque (head first) and one tile code per cell, so that
+        # moves and tile lookups don't depend on the snake length
+        self.body = deque()
+        self.grid = bytearray(board_size * board_size)
+        # Zobrist hash of the grid and of the head cell, kept up to date by every change of the grid
+        self.zobrist = 0
+        self._tile_keys, self._head_keys = zobrist_keys(board_size)
+        self._green_apples = set()
+        self._red_apples = set()
         self.console = console
 
         if state:
             self._load_state(state)
             self.update_free_positions()
         else:
-            self.free_positions = set(
-                (x, y) for x in range(self.board_size) for y in range(self.board_size)
-            )
+            self.free_positions = FreePositions.full(self.board_size)
             self.init_snake_pos(initial_length)
-            self.green_apple_positions = set()
-            self.red_apple_positions = set()
-            self.free_positions -= set(self.positions)
+            for pos in self.body:
+                self.free_positions.discard(pos)
             self._place_apples(2, "green")
             self._place_apples(1, "red")
 
-        self._save_state()
+        self.last_spawns = []
+        if history_mode == "delta":
+            self.initial_state = self._get_state()
+        else:
+            self._save_state()
         if console:
             self.log_console()
 
 
     def update_free_positions(self):
-        self.free_positions = set(
-            (x, y) for x in range(self.board_size) for y in range(self.board_size)
+        self.free_positions = FreePositions(
+            self.board_size, (pos for pos, code in zip(all_cells(self.board_size), self.grid) if code == EMPTY)
         )
-        self.free_positions -= set(self.positions)
-        self.free_positions -= self.green_apple_positions
-        self.free_positions -= self.red_apple_positions
 
     def init_snake_pos(self, initial_length=3):
         pos_ok = False
         while not pos_ok:
             pos = self._get_free_random_position()
-            self.dir = random.choice([UP, RIGHT, DOWN, LEFT])
-            self.positions = [(pos[0] - i * DIRECTIONS[self.dir][0], pos[1] - i * DIRECTIONS[self.dir][1]) for i in range(initial_length)]
-            pos_ok = all(self.is_legal(p) for p in self.positions)
-            next_pos = self.next_pos(self.positions[0], self.dir)
+            self.dir = self.rng.choice([UP, RIGHT, DOWN, LEFT])
+            positions = [(pos[0] - i * DIRECTIONS[self.dir][0], pos[1] - i * DIRECTIONS[self.dir][1]) for i in range(initial_length)]
+            pos_ok = all(self.is_legal(p) for p in positions)
+            next_pos = self.next_pos(positions[0], self.dir)
             pos_ok = pos_ok and self.is_legal(next_pos)
+        self.positions = positions
+
+    @property
+    def positions(self):
+        return list(self.body)
+
+    @positions.setter
+    def positions(self, positions):
+        if self.body:
+            self.zobrist ^= self._head_keys[self.body[0][0] * self.board_size + self.body[0][1]]
+        self._set_cells(self.body, EMPTY)
+        self.body = deque((p[0], p[1]) for p in positions)
+        self._set_cells(self.body, SNAKE)
+        if self.body:
+            self.zobrist ^= self._head_keys[self.body[0][0] * self.board_size + self.body[0][1]]
+
+    @property
+    def green_apple_positions(self):
+        return self._green_apples
+
+    @green_apple_positions.setter
+    def green_apple_positions(self, positions):
+        self._set_cells(self._green_apples, EMPTY)
+        self._green_apples = set(positions)
+        self._set_cells(self._green_apples, GREEN)
+
+    @property
+    def red_apple_positions(self):
+        return self._red_apples
+
+    @red_apple_positions.setter
+    def red_apple_positions(self, positions):
+        self._set_cells(self._red_apples, EMPTY)
+        self._red_apples = set(positions)
+        self._set_cells(self._red_apples, RED)
+
+    def _set_cells(self, positions, code):
+        keys = self._tile_keys
+        for pos in positions:
+            cell = pos[0] * self.board_size + pos[1]
+            self.zobrist ^= keys[self.grid[cell]][cell] ^ keys[code][cell]
+            self.grid[cell] = code
+
+    def compute_zobrist(self):
+        """Zobrist hash computed from scratch, equal to self.zobrist."""
+        keys = self._tile_keys
+        value = 0
+        for cell, code in enumerate(self.grid):
+            value ^= keys[code][cell]
+        if self.body:
+            value ^= self._head_keys[self.body[0][0] * self.board_size + self.body[0][1]]
+        return value
 
     def _load_state(self, state):
         self.positions = [(p[0], p[1]) for p in state["positions"]]
@@ -69,32 +267,29 @@ class Snake:
         self.green_apple_positions = set((pos[0], pos[1]) for pos in state["green_apples"])
         self.red_apple_positions = set((pos[0], pos[1]) for pos in state["red_apples"])
 
-    def _save_state(self):
-        state = {
-            "positions": self.positions[:],
+    def _get_state(self):
+        return {
+            "positions": list(self.body),
             "dir": self.dir,
             "green_apples": list(self.green_apple_positions),
             "red_apples": list(self.red_apple_positions),
         }
-        self.history.append(state)
+
+    def _save_state(self):
+        if self.history_mode == "delta":
+            self.history.append([self.dir, self.last_spawns])
+        elif self.history_mode != "off":
+            self.history.append(self._get_state())
 
     def log_console(self):
         readable_dir = ["UP", "RIGHT", "DOWN", "LEFT"]
         print(readable_dir[self.dir])
         print()
+        head = self.body[0]
         for row in range(-1, self.board_size + 1):
             for col in range(-1, self.board_size + 1):
-                if row == self.positions[0][0] or col == self.positions[0][1]:
-                    if row == -1 or row == self.board_size or col == -1 or col == self.board_size:
-                        print("W", end="")
-                    elif (row, col) in self.positions:
-                        print("S", end="")
-                    elif (row, col) in self.green_apple_positions:
-                        print("G", end="")
-                    elif (row, col) in self.red_apple_positions:
-                        print("R", end="")
-                    else:
-                        print("0", end="")
+                if row == head[0] or col == head[1]:
+                    print("0SGRW"[self.tile_code((row, col))], end="")
                 else:
                     print(" ", end="")
             print()
@@ -102,21 +297,29 @@ class Snake:
 
 
     def _get_free_random_position(self):
+        if self.forced_spawns is not None:
+            return self.forced_spawns.popleft() if self.forced_spawns else None
         if not self.free_positions:
             return None
-        return random.choice(list(self.free_positions))
+        return self.free_positions.sample(self.rng)
 
     def _place_apples(self, count, color):
         placed = False
         for _ in range(count):
             pos = self._get_free_random_position()
             if pos:
+                cell = pos[0] * self.board_size + pos[1]
                 if color == "green":
-                    self.green_apple_positions.add(pos)
+                    self._green_apples.add(pos)
+                    self.grid[cell] = GREEN
+                    self.zobrist ^= self._tile_keys[GREEN][cell]
                 else:
-                    self.red_apple_positions.add(pos)
+                    self._red_apples.add(pos)
+                    self.grid[cell] = RED
+                    self.zobrist ^= self._tile_keys[RED][cell]
 
                 self.free_positions.remove(pos)
+                self.last_spawns.append(pos)
                 placed = True
         return placed
 
@@ -131,11 +334,23 @@ class Snake:
         self.set_dir(direction_after_turn(self.dir, dir))
 
     def _pop_tail(self):
-        tail = self.positions.pop()
+        tail = self.body.pop()
+        cell = tail[0] * self.board_size + tail[1]
+        self.grid[cell] = EMPTY
+        self.zobrist ^= self._tile_keys[SNAKE][cell]
+        if not self.body:
+            self.zobrist ^= self._head_keys[cell]
         self.free_positions.add(tail)
 
     def _insert_head(self, head):
-        self.positions.insert(0, head)
+        cell = head[0] * self.board_size + head[1]
+        # The head may enter an apple: its key leaves the hash with it
+        self.zobrist ^= self._tile_keys[self.grid[cell]][cell] ^ self._tile_keys[SNAKE][cell] ^ self._head_keys[cell]
+        if self.body:
+            old_head = self.body[0]
+            self.zobrist ^= self._head_keys[old_head[0] * self.board_size + old_head[1]]
+        self.body.appendleft(head)
+        self.grid[cell] = SNAKE
         self.free_positions.discard(head)
 
     def next_pos(self, pos, dir):
@@ -146,69 +361,146 @@ class Snake:
     def is_legal(self, pos):
         return pos[0] >= 0 and pos[0] < self.board_size and pos[1] >= 0 and pos[1] < self.board_size
 
-    def tile_type(self, pos):
+    def tile_code(self, pos):
         if not self.is_legal(pos):
-            return "wall"
-        if pos in self.positions:
-            return "snake"
-        if pos in self.green_apple_positions:
-            return "green"
-        if pos in self.red_apple_positions:
-            return "red"
-        return "empty"
+            return WALL
+        return self.grid[pos[0] * self.board_size + pos[1]]
+
+    def tile_type(self, pos):
+        return TILE_NAMES[self.tile_code(pos)]
 
 
     def _make_move(self):
-        head = self.positions[0]
+        self.last_spawns = []
+        head = self.body[0]
         new_head = self.next_pos(head, self.dir)
 
-        scenari = self.tile_type(new_head)
+        scenari = self.tile_code(new_head)
 
-        if scenari == "wall":
+        if scenari == WALL:
             return False, scenari
-        if scenari == "snake":
-            if new_head == self.positions[-1]:
-                scenari = "empty"
+        if scenari == SNAKE:
+            if new_head == self.body[-1]:
+                scenari = EMPTY
             else:
                 return False, scenari
-        if scenari == "red" and len(self.positions) == 1:
+        if scenari == RED and len(self.body) == 1:
             return False, scenari
 
-        # Update snake
-        self._insert_head(new_head)
-        if scenari != "green":
+        # Update snake, tail first so that a head entering the old tail keeps its cell
+        if scenari != GREEN:
             self._pop_tail()
-        if scenari == "red":
+        if scenari == RED:
             self._pop_tail()
+        self._insert_head(new_head)
 
         # Update apples
-        if scenari in ["green", "red"]:
-            if scenari == "green":
-                self.green_apple_positions.remove(new_head)
-            else:
-                self.red_apple_positions.remove(new_head)
-            if not self._place_apples(1, scenari):
+        if scenari == GREEN:
+            self._green_apples.remove(new_head)
+            if not self._place_apples(1, "green"):
+                return False, scenari
+        elif scenari == RED:
+            self._red_apples.remove(new_head)
+            if not self._place_apples(1, "red"):
                 return False, scenari
 
         return True, scenari
 
-    def move(self):
+    def step(self):
+        """Same as move, but returns the tile code entered instead of its name."""
         res, scenari = self._make_move()
-        logging.debug(f'Move: {self.dir} Result: {res} Scenari: {scenari}')
+        if instrument.enabled:
+            instrument.count(TILE_NAMES[scenari] if res else "death_" + TILE_NAMES[scenari])
+            instrument.trace("move", dir=self.dir, res=res, tile=scenari)
         self._save_state()
         if self.console:
             self.log_console()
         return res, scenari
 
+    def move(self):
+        res, scenari = self.step()
+        return res, TILE_NAMES[scenari]
+
+    def replay_move(self, dir, spawns=None):
+        """Replays a recorded move, placing the recorded apples.
+
+        Without spawns, apples are drawn from the RNG, which gives back the
+        recorded game when the Snake was created with the same seed."""
+        self.dir = dir
+        if spawns is None:
+            return self.move()
+        self.forced_spawns = deque((p[0], p[1]) for p in spawns)
+        res = self.move()
+        self.forced_spawns = None
+        return res
+
+    def snapshot(self):
+        """State, RNG state and free cell order: enough for restore() to continue the exact same game."""
+        return {
+            "state": self._get_state(),
+            "rng": self.rng.getstate(),
+            "free": list(self.free_positions.cells),
+        }
+
+    def restore(self, snapshot):
+        self._load_state(snapshot["state"])
+        self.free_positions = FreePositions(self.board_size, snapshot["free"])
+        self.rng.setstate(snapshot["rng"])
+
     def get_positions(self):
-        return self.positions
+        return list(self.body)
 
     def get_head_position(self):
-        return self.positions[0]
+        return self.body[0]
 
     def get_score(self):
-        return len(self.positions) - 3
+        return len(self.body) - 3
 
     def save_game(self, filename="game_history.json"):
+        if self.history_mode == "delta":
+            data = {
+                "board_size": self.board_size,
+                "initial": self.initial_state,
+                "moves": self.history,
+            }
+        else:
+            data = list(self.history)
         with open(filename, "w") as f:
-            json.dump(self.history, f)
+            json.dump(data, f)
+
+def apply_action(snake, type, action):
+    if type == "turn":
+        if action == 0:
+            snake.turn("left")
+        elif action == 1:
+            snake.turn("right")
+    elif type == "dir":
+        snake.set_dir(action)
+
+def random_walk(snake, nmoves, rng=random):
+    """Plays nmoves random moves of snake, yielding (result, scenari) after each.
+
+    Each move turns left, turns right or goes straight on with equal odds (the
+    actions of the "turn" strategies). Dying does not stop the walk: the
+    caller breaks out or revives the snake."""
+    for _ in range(nmoves):
+        apply_action(snake, "turn", rng.randrange(3))
+        yield snake.move()
+
+def load_history(filename):
+    """Returns the full states of a game saved by save_game, whatever its history mode."""
+    return read_history(filename)[1]
+
+def read_history(filename):
+    """Returns (board size, full states) of a game saved by save_game.
+
+    Full histories don't record their board size: they are read as BOARD_SIZE."""
+    with open(filename) as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return BOARD_SIZE, data
+
+    snake = Snake(board_size=data["board_size"], state=data["initial"])
+    for dir, spawns in data["moves"]:
+        snake.replay_move(dir, spawns)
+    return data["board_size"], snake.history
@@ -1,6 +1,7 @@
+import numpy as np
 import pygame
 import pygame.gfxdraw
-from snake import UP, DOWN, LEFT, RIGHT
+from snake import UP, DOWN, LEFT, RIGHT, SNAKE, GREEN, RED, BOARD_SIZE
 from logger import logger as logging
 
 
@@ -8,7 +9,6 @@ from logger import logger as logging
 SCREEN_SIZE = 400
 UI_HEIGHT = 50
 TOTAL_HEIGHT = SCREEN_SIZE + UI_HEIGHT
-CELL_SIZE = SCREEN_SIZE // 10
 
 # Colors
 WHITE = (255, 255, 255)
@@ -20,8 +20,11 @@ GRID_DARK = (46,59,93)        # Dark cell color
 GRID_LIGHT = (57,69,107)      # Light cell color for checker pattern
 FONT = (109,124,174)
 
+# Sprite of the head heading to dir, after the tile codes
+HEAD = 8
+
 class UI:
-    def __init__(self, turn_based=False):
+    def __init__(self, turn_based=False, board_size=BOARD_SIZE):
         pygame.init()
         self.screen = pygame.display.set_mode((SCREEN_SIZE, TOTAL_HEIGHT))
         pygame.display.set_caption("🐍 Snake Game")
@@ -29,130 +32,162 @@ class UI:
         self.clock = pygame.time.Clock()
         self.max_fps = 5
         self.turn_based = turn_based
+        self.navbar = None
+        self._set_board_size(board_size)
 
-    def _draw_grid_background(self):
+    def _set_board_size(self, board_size):
+        """
+        Sizes the cells so that the board fits in the game area. The
+        pre-rendered surfaces are rebuilt at the next render.
         """
-        Draws a checkerboard-style grid in the game area
-        (below the navbar).
+        self.board_size = board_size
+        self.cell_size = max(1, SCREEN_SIZE // board_size)
+        self.background = None
+        # What was drawn at the last render, None to redraw everything
+        self.frame = None
+
+    def _build_background(self):
         """
-        # The game board starts at y = UI_HEIGHT
-        for row in range(10):
-            for col in range(10):
-                # Each cell is CELL_SIZE x CELL_SIZE
-                rect = pygame.Rect(
-                    col * CELL_SIZE,
-                    row * CELL_SIZE + UI_HEIGHT,  # offset by navbar height
-                    CELL_SIZE,
-                    CELL_SIZE
-                )
+        Pre-renders the checkerboard-style grid of the game area
+        (below the navbar) once.
+        """
+        size = self.cell_size
+        self.background = pygame.Surface((size * self.board_size, size * self.board_size))
+        for row in range(self.board_size):
+            for col in range(self.board_size):
+                rect = pygame.Rect(col * size, row * size, size, size)
                 if (row + col) % 2 == 0:
                     color = GRID_DARK
                 else:
                     color = GRID_LIGHT
-                pygame.draw.rect(self.screen, color, rect)
+                pygame.draw.rect(self.background, color, rect)
+
+    def _build_sprites(self):
+        """
+        Pre-renders what a cell can contain, indexed by tile code.
+        The head has small eyes: it has one sprite per direction, at HEAD + dir.
+        """
+        size = self.cell_size
+        body = pygame.Surface((size, size))
+        body.fill(SNAKE_GREEN)
+        green_apple = pygame.image.load("img/green_apple.png").convert_alpha()
+        red_apple = pygame.image.load("img/red_apple.png").convert_alpha()
+        self.sprites = {
+            SNAKE: body,
+            GREEN: pygame.transform.scale(green_apple, (size, size)),
+            RED: pygame.transform.scale(red_apple, (size, size)),
+        }
+
+        eye_radius = size // 20
+        near, far = size // 4, 3 * size // 4
+        eyes = {
+            UP: ((near, near), (far, near)),
+            DOWN: ((near, far), (far, far)),
+            LEFT: ((near, near), (near, far)),
+            RIGHT: ((far, near), (far, far)),
+        }
+        for direction, centers in eyes.items():
+            head = body.copy()
+            for x, y in centers:
+                pygame.gfxdraw.filled_circle(head, x, y, eye_radius, BLACK)
+            self.sprites[HEAD + direction] = head
+
+    def _build_glyphs(self):
+        """
+        Caches the surfaces of the navbar texts: the labels and each character of the values.
+        """
+        self.labels = {
+            "score": self.font.render("SCORE: ", True, FONT),
+            "speed": self.font.render("SPEED: ", True, FONT),
+        }
+        self.glyphs = {c: self.font.render(c, True, FONT) for c in "0123456789- FPS"}
+
+    def _blit_text(self, label, value, x):
+        self.screen.blit(self.labels[label], (x, 14))
+        x += self.labels[label].get_width()
+        for c in value:
+            self.screen.blit(self.glyphs[c], (x, 14))
+            x += self.glyphs[c].get_width()
 
     def _draw_navbar(self, score):
         """
-        Draws the top navbar with Score and Speed.
+        Draws the top navbar with Score and Speed, only when they changed.
+        Returns the dirty rect, or None.
         """
+        speed_str = "0 FPS" if self.turn_based else f"{self.max_fps} FPS"
+        if self.frame is not None and (score, speed_str) == self.navbar:
+            return None
+        self.navbar = (score, speed_str)
+
         navbar_rect = pygame.Rect(0, 0, SCREEN_SIZE, UI_HEIGHT)
         pygame.draw.rect(self.screen, NAVBAR_BG, navbar_rect)
+        self._blit_text("score", str(score), 15)
+        self._blit_text("speed", speed_str, 220)
+        return navbar_rect
 
-        score_text = self.font.render(f"SCORE: {score}", True, FONT)
-        if self.turn_based:
-            speed_str = "0 FPS"
-        else:
-            speed_str = f"{self.max_fps} FPS"
-        speed_text = self.font.render(f"SPEED: {speed_str}", True, FONT)
-
-        # Position them inside the navbar
-        self.screen.blit(score_text, (15, 14))
-        self.screen.blit(speed_text, (220, 14))
-
-    def _draw_apples(self, snake):
-        if not hasattr(self, 'green_apple_img'):
-            self.green_apple_img = pygame.image.load("img/green_apple.png")
-            self.green_apple_img = pygame.transform.scale(self.green_apple_img, (CELL_SIZE, CELL_SIZE))
-
-        if not hasattr(self, 'red_apple_img'):
-            self.red_apple_img = pygame.image.load("img/red_apple.png")
-            self.red_apple_img = pygame.transform.scale(self.red_apple_img, (CELL_SIZE, CELL_SIZE))
-
-        for apple in snake.green_apple_positions:
-            x = apple[1] * CELL_SIZE
-            y = apple[0] * CELL_SIZE + UI_HEIGHT
-            self.screen.blit(self.green_apple_img, (x, y))
-
-        for apple in snake.red_apple_positions:
-            x = apple[1] * CELL_SIZE
-            y = apple[0] * CELL_SIZE + UI_HEIGHT
-            self.screen.blit(self.red_apple_img, (x, y))
-
+    def _draw_cell(self, cell, sprite):
+        """
+        Draws the cell-th cell (row * board_size + col) from the background. Returns its rect.
+        """
+        size = self.cell_size
+        x = cell % self.board_size * size
+        y = cell // self.board_size * size
+        rect = pygame.Rect(x, y + UI_HEIGHT, size, size)
+        self.screen.blit(self.background, rect, pygame.Rect(x, y, size, size))
+        if sprite:
+            self.screen.blit(self.sprites[sprite], rect)
+        return rect
+
+    def invalidate(self):
+        """
+        Forces the next render to redraw everything (after the screen was used for something else).
+        """
+        self.frame = None
 
-    def _draw_snake(self, snake):
+    def draw(self, snake):
         """
-        Draws the snake. The head has small eyes.
+        Draws the game on the screen surface. Only the cells whose content
+        changed since the previous frame are redrawn (new head, vacated tail,
+        eaten and respawned apples), whatever snake was drawn before.
+        The cells follow the board size of snake.
+        Returns the dirty rects.
         """
-        positions = snake.get_positions()
-        if not positions:
-            return
-
-        # Draw head separately so we can give it eyes
-        head = positions[0]
-        head_rect = pygame.Rect(
-            head[1] * CELL_SIZE,
-            head[0] * CELL_SIZE + UI_HEIGHT,
-            CELL_SIZE,
-            CELL_SIZE
-        )
-        pygame.draw.rect(self.screen, SNAKE_GREEN, head_rect)
-
-        # Determine snake direction for eye placement
-        direction = snake.dir
-        eye_radius = 2
-        head_x = head_rect.x
-        head_y = head_rect.y
-
-        # Default eye positions (if facing right)
-        left_eye_center = (head_x + CELL_SIZE // 4, head_y + CELL_SIZE // 4)
-        right_eye_center = (head_x + 3 * CELL_SIZE // 4, head_y + CELL_SIZE // 4)
-
-        if direction == DOWN:
-            left_eye_center  = (head_x + CELL_SIZE // 4, head_y + 3 * CELL_SIZE // 4)
-            right_eye_center = (head_x + 3 * CELL_SIZE // 4, head_y + 3 * CELL_SIZE // 4)
-        elif direction == LEFT:
-            left_eye_center  = (head_x + CELL_SIZE // 4, head_y + CELL_SIZE // 4)
-            right_eye_center = (head_x + CELL_SIZE // 4, head_y + 3 * CELL_SIZE // 4)
-        elif direction == RIGHT:
-            left_eye_center  = (head_x + 3 * CELL_SIZE // 4, head_y + CELL_SIZE // 4)
-            right_eye_center = (head_x + 3 * CELL_SIZE // 4, head_y + 3 * CELL_SIZE // 4)
-
-        # Draw eyes (small black circles)
-        pygame.gfxdraw.filled_circle(self.screen, left_eye_center[0], left_eye_center[1], eye_radius, BLACK)
-        pygame.gfxdraw.filled_circle(self.screen, right_eye_center[0], right_eye_center[1], eye_radius, BLACK)
-
-        # Draw the rest of the body
-        for pos in positions[1:]:
-            rect = pygame.Rect(
-                pos[1] * CELL_SIZE,
-                pos[0] * CELL_SIZE + UI_HEIGHT,
-                CELL_SIZE,
-                CELL_SIZE
-            )
-            pygame.draw.rect(self.screen, SNAKE_GREEN, rect)
+        if snake.board_size != self.board_size:
+            self._set_board_size(snake.board_size)
+        if self.background is None:
+            self._build_background()
+            self._build_sprites()
+            self._build_glyphs()
+
+        # Content of each cell: the tile code, or HEAD + dir for the head
+        frame = np.frombuffer(snake.grid, dtype=np.uint8).copy()
+        head = snake.get_head_position()
+        frame[head[0] * self.board_size + head[1]] = HEAD + snake.dir
+
+        dirty = []
+        navbar_rect = self._draw_navbar(snake.get_score())
+        if navbar_rect:
+            dirty.append(navbar_rect)
+
+        if self.frame is None:
+            self.screen.fill(DARK_BG, pygame.Rect(0, UI_HEIGHT, SCREEN_SIZE, SCREEN_SIZE))
+            self.screen.blit(self.background, (0, UI_HEIGHT))
+            for cell in np.flatnonzero(frame):
+                self._draw_cell(cell, int(frame[cell]))
+            dirty = [self.screen.get_rect()]
+        else:
+            for cell in np.flatnonzero(frame != self.frame):
+                dirty.append(self._draw_cell(cell, int(frame[cell])))
+        self.frame = frame
+        return dirty
 
     def render(self, snake):
-        # 1) Draw the top navbar
-        self._draw_navbar(snake.get_score())
-
-        # 2) Draw the checkerboard background for the game area
-        self._draw_grid_background()
-
-        # 3) Draw apples and snake
-        self._draw_apples(snake)
-        self._draw_snake(snake)
-
-        pygame.display.flip()
+        """
+        Draws the game and updates the changed parts of the display.
+        """
+        dirty = self.draw(snake)
+        if dirty:
+            pygame.display.update(dirty)
         self.clock.tick(1000 if self.turn_based else self.max_fps)
 
 
@@ -200,6 +235,26 @@ class UI:
                     self.max_fps = max(1, self.max_fps - 1)
         return None, 0
 
+    def set_caption(self, caption):
+        pygame.display.set_caption(f"🐍 Snake Game - {caption}")
+
+    def get_watch_input(self):
+        """
+        Non-blocking input of the spectator mode: "quit", "follow" (F key) or None.
+        The arrows change the speed.
+        """
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                return "quit"
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_f:
+                    return "follow"
+                if event.key == pygame.K_RIGHT:
+                    self.set_speed("faster")
+                if event.key == pygame.K_LEFT:
+                    self.set_speed("slower")
+        return None
+
     def quit(self):
         pygame.quit()
 
@@ -212,6 +267,7 @@ class UI:
             self.turn_based = not self.turn_based
 
     def select_ai_model(self, models):
+        self.invalidate()
         if not models:
             logging.warning("No AI models found! Defaulting to v0.")
             return "v0"
@@ -242,6 +298,7 @@ class UI:
                         return models[selected]
 
     def show_menu(self, models):
+        self.invalidate()
         self.screen.fill(BLACK)
         title = self.font.render("Select Mode", True, WHITE)
         player_option = self.font.render("1. Player", True, WHITE)
@@ -264,6 +321,7 @@ class UI:
                         return "ai", self.select_ai_model(models)
 
     def game_over_screen(self, score):
+        self.invalidate()
 
         selected = 0
         while True:
@@ -0,0 +1,239 @@
+import numpy as np
+from snake import BOARD_SIZE, DIRECTIONS, TURN_LEFT, TURN_RIGHT, UP, RIGHT, DOWN, LEFT
+from snake import EMPTY, SNAKE, GREEN, RED, WALL
+
+DIRS = np.array(DIRECTIONS)
+OPPOSITE = np.array([DOWN, LEFT, UP, RIGHT])
+
+# New direction indexed by [turn action, current direction]: left, right, forward
+TURNS = np.array([TURN_LEFT, TURN_RIGHT, [UP, RIGHT, DOWN, LEFT]])
+
+
+class SnakeBatch:
+    """N independent games stepped together, with the same rules as Snake.
+
+    Every board lives in preallocated arrays. Cells are indexed by
+    row * board_size + col, and the body of game i is stored in a ring
+    buffer: body[i, (start[i] + k) % ncells] is its k-th segment (0 is the head).
+    """
+
+    def __init__(self, n, board_size=BOARD_SIZE, initial_length=3, seed=None):
+        self.n = n
+        self.board_size = board_size
+        self.ncells = board_size * board_size
+        self.initial_length = initial_length
+        self.rng = np.random.default_rng(seed)
+        self.rows = np.arange(n)
+
+        self.head = np.zeros(n, dtype=np.int64)
+        self.dir = np.zeros(n, dtype=np.int64)
+        self.body = np.zeros((n, self.ncells), dtype=np.int64)
+        self.start = np.zeros(n, dtype=np.int64)
+        self.length = np.zeros(n, dtype=np.int64)
+        self.grid = np.zeros((n, self.ncells), dtype=np.uint8)
+        self.green = np.full((n, 2), -1, dtype=np.int64)
+        self.red = np.full((n, 1), -1, dtype=np.int64)
+        self.moves = np.zeros(n, dtype=np.int64)
+        self.done = np.zeros(n, dtype=bool)
+
+        # State before the last step, used by the strategies' rewards
+        self.prev_dir = np.zeros(n, dtype=np.int64)
+        self.prev_head = np.zeros(n, dtype=np.int64)
+
+        self.reset()
+
+    def reset(self, mask=None):
+        """Starts a new game on every board selected by mask (all by default)."""
+        idx = self.rows if mask is None else np.flatnonzero(mask)
+        if idx.size == 0:
+            return
+        size = self.board_size
+        self.grid[idx] = EMPTY
+        self.moves[idx] = 0
+        self.done[idx] = False
+
+        # Same draw as Snake.init_snake_pos: retry until body and next cell are on the board
+        pending = idx
+        while pending.size:
+            cell = self.rng.integers(self.ncells, size=pending.size)
+            dirs = self.rng.integers(4, size=pending.size)
+            row, col = cell // size, cell % size
+            dr, dc = DIRS[dirs].T
+            tail_row = row - (self.initial_length - 1) * dr
+            tail_col = col - (self.initial_length - 1) * dc
+            ok = (tail_row >= 0) & (tail_row < size) & (tail_col >= 0) & (tail_col < size)
+            ok &= (row + dr >= 0) & (row + dr < size) & (col + dc >= 0) & (col + dc < size)
+
+            games = pending[ok]
+            self.head[games] = cell[ok]
+            self.dir[games] = dirs[ok]
+            self.start[games] = 0
+            self.length[games] = self.initial_length
+            step = dr[ok] * size + dc[ok]
+            for k in range(self.initial_length):
+                segment = cell[ok] - k * step
+                self.body[games, k] = segment
+                self.grid[games, segment] = SNAKE
+            pending = pending[~ok]
+
+        self.green[idx, 0] = self._spawn(idx, GREEN)
+        self.green[idx, 1] = self._spawn(idx, GREEN)
+        self.red[idx, 0] = self._spawn(idx, RED)
+        self.prev_dir[idx] = self.dir[idx]
+        self.prev_head[idx] = self.head[idx]
+
+    def _spawn(self, idx, code):
+        """Places one apple on a uniformly drawn free cell of each game in idx.
+
+        Returns the chosen cells, -1 where the board is full."""
+        free = self.grid[idx] == EMPTY
+        counts = free.sum(axis=1)
+        pick = (self.rng.random(idx.size) * counts).astype(np.int64)
+        cells = np.argmax(np.cumsum(free, axis=1) > pick[:, None], axis=1)
+        cells[counts == 0] = -1
+        ok = cells >= 0
+        self.grid[idx[ok], cells[ok]] = code
+        return cells
+
+    def _pop_tail(self, idx):
+        tail = self.body[idx, (self.start[idx] + self.length[idx] - 1) % self.ncells]
+        self.grid[idx, tail] = EMPTY
+        self.length[idx] -= 1
+
+    def _insert_head(self, idx, cells):
+        self.start[idx] = (self.start[idx] - 1) % self.ncells
+        self.body[idx, self.start[idx]] = cells
+        self.grid[idx, cells] = SNAKE
+        self.length[idx] += 1
+        self.head[idx] = cells
+
+    def _eat(self, idx, cells, apples, code):
+        """Replaces the eaten apples of games idx, returns where no free cell was left."""
+        slot = np.argmax(apples[idx] == cells[:, None], axis=1)
+        new = self._spawn(idx, code)
+        apples[idx, slot] = new
+        return new < 0
+
+    def set_dir(self, actions, action_type="turn"):
+        """Applies one action per game, like index.apply_action does for a Snake."""
+        actions = np.asarray(actions)
+        if action_type == "turn":
+            new_dir = TURNS[np.minimum(actions, 2), self.dir]
+        else:
+            new_dir = np.where(actions == OPPOSITE[self.dir], self.dir, actions)
+        self.dir = np.where(self.done, self.dir, new_dir)
+
+    def step(self, actions, action_type="turn"):
+        """Plays one move on every running game.
+
+        Returns (result, scenari, done): result is False for games that died on
+        this move or were already over, scenari holds the tile codes entered."""
+        alive = ~self.done
+        self.prev_dir = self.dir.copy()
+        self.prev_head = self.head.copy()
+        self.set_dir(actions, action_type)
+
+        size = self.board_size
+        dr, dc = DIRS[self.dir].T
+        row = self.head // size + dr
+        col = self.head % size + dc
+        inside = (row >= 0) & (row < size) & (col >= 0) & (col < size)
+        cells = np.where(inside, row * size + col, 0)
+        scenari = np.where(inside, self.grid[self.rows, cells], WALL)
+
+        # Moving into the tail is allowed, it is vacated on the same move
+        tail = self.body[self.rows, (self.start + self.length - 1) % self.ncells]
+        scenari[(scenari == SNAKE) & (cells == tail)] = EMPTY
+
+        dead = (scenari == WALL) | (scenari == SNAKE) | ((scenari == RED) & (self.length == 1))
+        move = alive & ~dead
+
+        # Pop before inserting, so a head entering the old tail keeps its cell marked
+        self._pop_tail(np.flatnonzero(move & (scenari != GREEN)))
+        self._pop_tail(np.flatnonzero(move & (scenari == RED)))
+        idx = np.flatnonzero(move)
+        self._insert_head(idx, cells[idx])
+
+        result = move.copy()
+        idx = np.flatnonzero(move & (scenari == GREEN))
+        result[idx[self._eat(idx, cells[idx], self.green, GREEN)]] = False
+        idx = np.flatnonzero(move & (scenari == RED))
+        result[idx[self._eat(idx, cells[idx], self.red, RED)]] = False
+
+        self.moves[alive] += 1
+        self.done |= alive & ~result
+        scenari[~alive] = EMPTY
+        return result, scenari, self.done.copy()
+
+    def relative_dirs(self):
+        """Absolute directions on the left, right and in front of each snake, shape (n, 3)."""
+        return np.stack([np.array(TURN_LEFT)[self.dir], np.array(TURN_RIGHT)[self.dir], self.dir], axis=1)
+
+    def neighbor_tiles(self, dirs):
+        """Tile code of the cell next to each head in direction dirs[i]."""
+        size = self.board_size
+        dr, dc = DIRS[dirs].T
+        row = self.head // size + dr
+        col = self.head % size + dc
+        inside = (row >= 0) & (row < size) & (col >= 0) & (col < size)
+        return np.where(inside, self.grid[self.rows, np.where(inside, row * size + col, 0)], WALL)
+
+    def ray_tiles(self, dirs):
+        """First non-empty tile code seen from each head in direction dirs[i] (WALL if none)."""
+        size = self.board_size
+        dr, dc = DIRS[dirs].T
+        row0 = self.head // size
+        col0 = self.head % size
+        seen = np.full(self.n, WALL, dtype=np.uint8)
+        pending = np.ones(self.n, dtype=bool)
+        for k in range(1, size):
+            row = row0 + k * dr
+            col = col0 + k * dc
+            inside = (row >= 0) & (row < size) & (col >= 0) & (col < size)
+            pending &= inside
+            if not pending.any():
+                break
+            tiles = self.grid[self.rows, np.where(inside, row * size + col, 0)]
+            hit = pending & (tiles != EMPTY)
+            seen[hit] = tiles[hit]
+            pending &= ~hit
+        return seen
+
+    def get_score(self):
+        return self.length - 3
+
+    def get_positions(self, i):
+        """Body of game i as (row, col) tuples, head first."""
+        cells = self.body[i, (self.start[i] + np.arange(self.length[i])) % self.ncells]
+        return [(int(c) // self.board_size, int(c) % self.board_size) for c in cells]
+
+    def get_state(self, i):
+        """State of game i in the format of Snake._save_state."""
+        def coords(cells):
+            return [(int(c) // self.board_size, int(c) % self.board_size) for c in cells if c >= 0]
+
+        return {
+            "positions": self.get_positions(i),
+            "dir": int(self.dir[i]),
+            "green_apples": coords(self.green[i]),
+            "red_apples": coords(self.red[i]),
+        }
+
+    def set_state(self, i, state):
+        """Loads a Snake state dict into game i."""
+        size = self.board_size
+        cells = [p[0] * size + p[1] for p in state["positions"]]
+        self.grid[i] = EMPTY
+        self.body[i, :len(cells)] = cells
+        self.grid[i, cells] = SNAKE
+        self.start[i] = 0
+        self.length[i] = len(cells)
+        self.head[i] = cells[0]
+        self.dir[i] = state["dir"]
+        for apples, positions, code in ((self.green, state["green_apples"], GREEN), (self.red, state["red_apples"], RED)):
+            apples[i] = -1
+            for slot, p in enumerate(positions):
+                apples[i, slot] = p[0] * size + p[1]
+                self.grid[i, apples[i, slot]] = code
+        self.moves[i] = 0
+        self.done[i] = False
@@ -0,0 +1,80 @@
+import threading
+from snake import Snake, BOARD_SIZE
+from snakeUI import UI
+from logger import logger as logging
+
+
+class Spectator:
+    """Watches a training or test loop running at full speed in a thread.
+
+    The loop calls publish(snake) after each move and start_episode() before
+    each game, and stops when stopped is set. The UI runs in the main thread
+    at its own frame rate: publish only copies the state when the UI asked
+    for a new frame, so the loop is not slowed down by the rendering.
+
+    Pressing F follows the next episode at the UI speed: the loop then waits
+    for each of its moves to be drawn."""
+
+    def __init__(self, ui=None, fps=10):
+        self.ui = ui
+        self.fps = fps
+        self.stopped = threading.Event()
+        self.requested = True
+        # (number of the state, state) of the last state published, and number of the last state drawn
+        self.latest = (0, None)
+        self.board_size = BOARD_SIZE
+        self.drawn = 0
+        self.drawn_changed = threading.Condition()
+        self.episode = None
+        self.follow_next = False
+        self.following = False
+
+    def start_episode(self, episode):
+        self.episode = episode
+        self.following = self.follow_next
+        self.follow_next = False
+
+    def publish(self, snake):
+        self.board_size = snake.board_size
+        if self.following:
+            number = self.latest[0] + 1
+            self.latest = (number, snake._get_state())
+            with self.drawn_changed:
+                while self.drawn < number and not self.stopped.is_set():
+                    self.drawn_changed.wait(0.1)
+        elif self.requested:
+            self.latest = (self.latest[0] + 1, snake._get_state())
+            self.requested = False
+
+    def run(self, target, *args, **kwargs):
+        """Runs target(*args, spectator=self, **kwargs) in a thread and shows it until it returns."""
+        thread = threading.Thread(target=target, args=args, kwargs=dict(kwargs, spectator=self), daemon=True)
+        if self.ui is None:
+            self.ui = UI()
+        ui = self.ui
+        ui.max_fps = self.fps
+
+        thread.start()
+        episode = None
+        while thread.is_alive():
+            number, state = self.latest
+            if number != self.drawn:
+                if episode != self.episode:
+                    episode = self.episode
+                    ui.set_caption(f"Episode {episode}" + (" (followed)" if self.following else ""))
+                ui.render(Snake(board_size=self.board_size, state=state, history_mode="off"))
+                with self.drawn_changed:
+                    self.drawn = number
+                    self.drawn_changed.notify()
+            else:
+                ui.clock.tick(ui.max_fps)
+            self.requested = True
+
+            input = ui.get_watch_input()
+            if input == "quit":
+                logging.info("Stopping...")
+                self.stopped.set()
+            elif input == "follow":
+                self.follow_next = True
+        thread.join()
+        ui.quit()
@@ -0,0 +1,85 @@
+import os
+import random
+import signal
+import numpy as np
+import pytest
+import policy
+from checkpoint import Checkpointer, atomic_save, get_rng_state, set_rng_state, load_checkpoint, restore_checkpoint
+
+
+@pytest.mark.parametrize("make_rng", [random.Random, np.random.default_rng])
+def test_rng_state_roundtrip(make_rng):
+    rng = make_rng(1)
+    state = get_rng_state(rng)
+    expected = [rng.random() for _ in range(5)]
+
+    other = make_rng(2)
+    set_rng_state(other, state)
+    assert [other.random() for _ in range(5)] == expected
+
+
+def test_checkpointer_and_restore(tmp_path):
+    filename = str(tmp_path / "checkpoint.npz")
+    rng = random.Random(3)
+    q_table = np.arange(12, dtype=float).reshape(4, 3)
+
+    checkpointer = Checkpointer(filename, every=10, seconds=3600)
+    checkpointer.step(5, q_table, 0.5, rng)
+    checkpointer.wait()
+    assert not (tmp_path / "checkpoint.npz").exists()
+    checkpointer.step(10, q_table, 0.25, rng)
+    q_table[0, 0] = 100  # after the copy: not in the checkpoint
+    checkpointer.wait()
+
+    assert load_checkpoint(filename)["q_table"][0, 0] == 0
+    restored = np.zeros((4, 3))
+    other = random.Random(4)
+    assert restore_checkpoint(filename, restored, other) == (10, 0.25)
+    assert restored[1, 2] == 5
+    assert other.random() == rng.random()
+
+
+def test_atomic_save_keeps_previous_file(tmp_path):
+    filename = tmp_path / "Q_table.npy"
+    atomic_save(filename, lambda f: np.save(f, np.ones(3)))
+
+    def failing(f):
+        f.write(b"partial")
+        raise OSError("disk full")
+    with pytest.raises(OSError):
+        atomic_save(filename, failing)
+    assert (np.load(filename) == 1).all()
+    assert not (tmp_path / "Q_table.npy.tmp").exists()
+
+
+def test_restore_without_checkpoint(tmp_path):
+    assert restore_checkpoint(str(tmp_path / "missing.npz"), np.zeros(3), random.Random()) == (0, 1.0)
+
+
+@pytest.mark.parametrize("options", [{}, {"plan_sweeps": 2}, {"replay_size": 500}])
+def test_interrupted_train_resumes_exactly(tmp_path, monkeypatch, options):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import index
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "v1").mkdir()
+    quiet = lambda *args, **kwargs: None
+
+    expected = np.zeros((224, 3))
+    index.train(False, expected, "v1", quiet, seed=4, num_episodes=30, **options)
+
+    calls = 0
+    def choose_action(*args):
+        nonlocal calls
+        calls += 1
+        if calls == 100:
+            os.kill(os.getpid(), signal.SIGINT)
+        return policy.choose_action(*args)
+    monkeypatch.setattr(index, "choose_action", choose_action)
+    interrupted = np.zeros((224, 3))
+    index.train(False, interrupted, "v1", quiet, seed=4, num_episodes=30, **options)
+    episode = load_checkpoint("v1/checkpoint.npz")["episode"]
+    assert 0 < episode < 30
+
+    resumed = np.zeros((224, 3))
+    index.train(False, resumed, "v1", quiet, seed=4, resume=True, num_episodes=30, **options)
+    assert np.array_equal(resumed, expected)
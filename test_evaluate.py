@@ -0,0 +1,61 @@
+import pytest
+import numpy as np
+from snake import Snake, game_seed, UP, RIGHT, DOWN, LEFT
+from evaluate import evaluate, play_game, LoopDetector
+from qstore import load_q_table, is_mapped, QuantizedQTable
+from checkpoint import save_model
+import v0.strategy
+import v1.strategy
+
+def test_workers_play_the_seeded_games():
+    q_table = np.load("v1/Q_table.npy")
+    expected = sorted(
+        play_game(Snake(history_mode="off", seed=game_seed(5, game)), q_table, v1.strategy.state_to_index, "turn")[0]
+        for game in range(6)
+    )
+    assert sorted(evaluate("v1", q_table, 6, 3, seed=5)) == expected
+
+def test_loop_detector():
+    # Turning in a 2x2 square forever, apples out of the way
+    state = {"positions": [(5, 5), (5, 4), (4, 4)], "dir": RIGHT, "green_apples": [(0, 0), (0, 1)], "red_apples": [(9, 9)]}
+    snake = Snake(state=state, history_mode="off")
+    loop = LoopDetector()
+    for nmoves, dir in enumerate([UP, LEFT, DOWN, RIGHT] * 10):
+        snake.set_dir(dir)
+        result, scenari = snake.move()
+        assert result
+        if loop.check(snake, False):
+            break
+    assert nmoves < 16
+
+    # An apple event forgets the states seen before it
+    loop.check(snake, True)
+    assert not loop.check(snake, False)
+
+def test_looping_games_are_cut():
+    # v0 plays one fixed move per state: its greedy games loop
+    q_table = np.load("v0/Q_table.npy")
+    score, scenari, nmoves = play_game(Snake(history_mode="off", seed=game_seed(1, 0)), q_table, v0.strategy.state_to_index, "turn")
+    assert scenari == "loop" and nmoves < 1000
+
+def test_workers_map_the_model_file():
+    # A memory-mapped table is not copied to shared memory: each worker maps the file
+    q_table = load_q_table("v1")
+    assert is_mapped(q_table)
+    assert sorted(evaluate("v1", q_table, 6, 2, seed=5)) == sorted(evaluate("v1", np.load("v1/Q_table.npy"), 6, 3, seed=5))
+
+def test_workers_map_an_int16_model(tmp_path, monkeypatch):
+    (tmp_path / "v1").mkdir()
+    save_model(str(tmp_path / "v1"), np.load("v1/Q_table.npy"), "int16")
+    monkeypatch.chdir(tmp_path)
+    q_table = load_q_table("v1")
+    assert isinstance(q_table, QuantizedQTable) and is_mapped(q_table)
+    expected = sorted(
+        play_game(Snake(history_mode="off", seed=game_seed(5, game)), q_table, v1.strategy.state_to_index, "turn")[0]
+        for game in range(4)
+    )
+    assert sorted(evaluate("v1", q_table, 4, 2, seed=5)) == expected
+
+def test_dead_worker_is_reported():
+    with pytest.raises(RuntimeError, match="Worker 0 died"):
+        evaluate("no_such_model", np.zeros((8, 3)), 2, 1, seed=5)
@@ -0,0 +1,59 @@
+import pytest
+from PIL import Image
+from snake import Snake
+from replay import ReplayWriter
+import export as export_module
+from export import export, find_games
+
+
+def save_games(directory, ngames):
+    for game in range(ngames):
+        snake = Snake(history_mode="off", seed=game)
+        with ReplayWriter(directory / f"game_{game}.replay", snake) as writer:
+            for _ in range(9):
+                snake.move()
+                writer.record(snake)
+    json_snake = Snake(seed=ngames)
+    json_snake.move()
+    json_snake.save_game(directory / "history.json")
+
+
+def test_export_png_and_gif(tmp_path):
+    save_games(tmp_path, 2)
+    filenames = find_games(str(tmp_path))
+    assert len(filenames) == 3
+
+    assert export(filenames, str(tmp_path / "png"), "png", every=3, nworkers=2) == 3
+    # 10 states: 0, 3, 6, 9
+    assert len(list((tmp_path / "png" / "game_0").iterdir())) == 4
+    assert len(list((tmp_path / "png" / "history").iterdir())) == 2
+
+    assert export(filenames[:1], str(tmp_path / "gif"), "gif") == 1
+    assert (tmp_path / "gif" / "game_0.gif").stat().st_size > 0
+    # Identical frames are merged, with their durations added
+    with Image.open(tmp_path / "gif" / "game_0.gif") as gif:
+        durations = []
+        for n in range(gif.n_frames):
+            gif.seek(n)
+            durations.append(gif.info["duration"])
+        assert gif.n_frames > 1 and sum(durations) == 10 * 100
+
+
+def test_dead_worker_is_reported(tmp_path, monkeypatch):
+    save_games(tmp_path, 1)
+    def broken_ui():
+        raise RuntimeError("no display")
+    monkeypatch.setattr(export_module, "headless_ui", broken_ui)
+    with pytest.raises(RuntimeError, match="Worker 0 died"):
+        export(find_games(str(tmp_path)), str(tmp_path / "gif"), "gif")
+
+
+def test_long_gif_is_subsampled(tmp_path, monkeypatch):
+    save_games(tmp_path, 1)
+    monkeypatch.setattr(export_module, "MAX_GIF_FRAMES", 4)
+    ui = export_module.headless_ui()
+    try:
+        # 10 states: 0, 3, 6, 9
+        assert export_module.export_game(ui, str(tmp_path / "game_0.replay"), str(tmp_path), "gif") == 4
+    finally:
+        ui.quit()
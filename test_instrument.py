@@ -0,0 +1,30 @@
+import instrument
+from importlib import import_module
+from snake import Snake
+from env import Env
+
+
+def test_wrap_is_free_when_disabled():
+    assert not instrument.enabled
+    function = lambda x: x
+    assert instrument.wrap("phase", function) is function
+
+
+def test_enabled_timers_and_counters():
+    instrument.enable(every=1)
+    try:
+        env = Env(import_module("v1.strategy"), "turn")
+        env.reset(Snake(history_mode="off", seed=0))
+        done = False
+        steps = 0
+        while not done:
+            _, _, done = env.step(2)
+            steps += 1
+        assert instrument.calls["move"] == steps
+        assert instrument.calls["state"] == steps  # the terminal state is not encoded
+        assert sum(instrument.counters.values()) == steps
+        assert any(event.startswith("death_") for event in instrument.counters)
+        assert [t["kind"] for t in instrument.traces].count("move") == steps
+    finally:
+        instrument.enabled = False
+        instrument.reset()
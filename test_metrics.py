@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from metrics import MetricsWriter, load_metrics
+
+
+@pytest.mark.parametrize("name", ["metrics.csv", "metrics"])
+def test_blocks_are_appended(tmp_path, name):
+    filename = str(tmp_path / name)
+    with MetricsWriter(filename, block_size=4, report_every=0) as metrics:
+        for episode in range(10):
+            metrics.record(episode, episode * 2, 100 + episode, episode % 5 - 1, 0.5, 0.25)
+        assert len(load_metrics(filename)) == 8  # two full blocks flushed
+
+    # A second run appends to the same file
+    with MetricsWriter(filename, block_size=4, report_every=0) as metrics:
+        metrics.record(10, 20, 110, 1)
+
+    records = load_metrics(filename)
+    assert list(records["episode"]) == list(range(11))
+    assert records["score"][3] == 6 and records["moves"][3] == 103
+    assert list(records["death"][:5]) == [-1, 0, 1, 2, 3]
+    assert records["epsilon"][0] == 0.5 and np.isnan(records["epsilon"][10])
+    assert (np.diff(records["time"][:10]) >= 0).all()
+
+
+def test_rolling_window():
+    metrics = MetricsWriter(window=4, report_every=0)
+    for score in [100, 1, 2, 3, 4]:
+        metrics.record(0, score, 1)
+    mean, p50, p90, best = metrics.rolling()
+    assert mean == 2.5 and p50 == 2.5 and best == 4
@@ -0,0 +1,40 @@
+import numpy as np
+from planning import PlanningModel, model_bytes
+
+def test_plan_solves_the_model():
+    # 0 -> 1 -> end, rewards 1 then 10, action 1 never tried
+    model = PlanningModel(2, 2)
+    for _ in range(3):
+        model.record(0, 0, 1.0, 1)
+        model.record(1, 0, 10.0, None)
+    q_table = np.zeros((2, 2))
+    model.plan(q_table, 0.5, sweeps=5)
+    assert q_table[1, 0] == 10.0
+    assert q_table[0, 0] == 1.0 + 0.5 * 10.0
+    assert q_table[0, 1] == 0 and q_table[1, 1] == 0
+
+def test_plan_averages_outcomes():
+    model = PlanningModel(3, 1)
+    model.record(0, 0, 0.0, 1)
+    model.record(0, 0, 0.0, 2)
+    model.record(1, 0, 4.0, None)
+    model.record(2, 0, -2.0, None)
+    q_table = np.zeros((3, 1))
+    model.plan(q_table, 1.0, sweeps=2)
+    assert q_table[0, 0] == 1.0
+
+def test_checkpoint_arrays():
+    model = PlanningModel(2, 2)
+    model.record(0, 1, 3.0, None)
+    arrays = model.checkpoint_arrays()
+    model.record(1, 0, 1.0, 0)
+    loaded = PlanningModel(2, 2)
+    loaded.restore_arrays(arrays)
+    assert loaded.counts.sum() == 1 and loaded.counts[0, 1, 2] == 1 and loaded.reward_sums[0, 1] == 3.0
+    empty = PlanningModel(2, 2)
+    empty.restore_arrays({})
+    assert not empty.counts.any()
+
+def test_model_bytes():
+    model = PlanningModel(30, 4)
+    assert model_bytes(30, 4) == model.counts.nbytes + model.reward_sums.nbytes
@@ -0,0 +1,94 @@
+import random
+import numpy as np
+import pytest
+from policy import choose_action, q_update
+from qstore import SparseQTable, table_arrays, table_from_arrays, load_q_table, quantize, is_mapped, QuantizedQTable
+from checkpoint import save_model, save_checkpoint, check_checkpoint, restore_checkpoint, get_rng_state
+
+def test_sparse_table_like_dense():
+    dense = np.zeros((50, 3))
+    sparse = SparseQTable(50, 3)
+    rng = random.Random(0)
+    for _ in range(2000):
+        state, next_state = rng.randrange(50), rng.choice([None, rng.randrange(50)])
+        action = int(choose_action(dense, state, 0.3, random.Random(state)))
+        assert int(choose_action(sparse, state, 0.3, random.Random(state))) == action
+        reward = rng.choice([-1.0, 10.0])
+        q_update(dense, state, action, reward, next_state, 0.1, 0.9)
+        q_update(sparse, state, action, reward, next_state, 0.1, 0.9)
+    for state in range(50):
+        assert np.allclose(sparse[state], dense[state], atol=1e-4)
+    assert len(sparse) == 50 and sparse.shape == dense.shape
+
+def test_reading_does_not_store():
+    sparse = SparseQTable(10, 2)
+    assert not sparse[3].any() and sparse[3, 1] == 0
+    assert not sparse.rows
+    with pytest.raises(ValueError):
+        sparse[3][0] = 1.0
+
+def test_lru_eviction():
+    sparse = SparseQTable(10, 2, max_states=2)
+    sparse[0, 0] = 1.0
+    sparse[1, 0] = 2.0
+    sparse[0]  # 0 is now more recent than 1
+    sparse[2, 0] = 3.0
+    assert set(sparse.rows) == {0, 2} and sparse.evictions == 1
+
+def test_save_load(tmp_path):
+    sparse = SparseQTable(1000, 3)
+    sparse[7, 2] = 1.5
+    sparse[999] = [1, 2, 3]
+    copy = table_from_arrays(table_arrays(sparse))
+    assert copy.shape == sparse.shape and copy[7, 2] == 1.5 and list(copy[999]) == [1, 2, 3]
+
+    np.save(tmp_path / "Q_table.npy", np.zeros((1000, 3)))
+    save_model(str(tmp_path), sparse)
+    assert not (tmp_path / "Q_table.npy").exists()
+    assert load_q_table(str(tmp_path))[7, 2] == 1.5
+
+    filename = str(tmp_path / "checkpoint.npz")
+    save_checkpoint(filename, sparse, 12, 0.5, get_rng_state(random.Random(1)))
+    restored = SparseQTable(1000, 3)
+    assert restore_checkpoint(filename, restored, random.Random()) == (12, 0.5)
+    assert restored[7, 2] == 1.5 and list(restored[999]) == [1, 2, 3]
+
+def test_restore_incompatible_checkpoint(tmp_path):
+    sparse = SparseQTable(100, 3)
+    sparse[7, 2] = 1.5
+    assert np.asarray(sparse).shape == (100, 3)
+    filename = str(tmp_path / "checkpoint.npz")
+    save_checkpoint(filename, sparse, 12, 0.5, get_rng_state(random.Random(1)))
+    for q_table in [np.zeros((100, 3)), SparseQTable(200, 3)]:
+        with pytest.raises(ValueError, match="incompatible"):
+            check_checkpoint(filename, q_table)
+        with pytest.raises(ValueError, match="incompatible"):
+            restore_checkpoint(filename, q_table, random.Random())
+
+    save_checkpoint(filename, np.zeros((100, 3)), 12, 0.5, get_rng_state(random.Random(1)))
+    for q_table in [SparseQTable(100, 3), np.zeros((200, 3))]:
+        with pytest.raises(ValueError, match="incompatible"):
+            restore_checkpoint(filename, q_table, random.Random())
+
+@pytest.mark.parametrize("precision", ["float64", "float32", "int16"])
+def test_saved_precisions(tmp_path, precision):
+    q_table = np.random.default_rng(0).normal(size=(500, 3)) * 100
+    save_model(str(tmp_path), q_table, precision)
+    loaded = load_q_table(str(tmp_path))
+    assert is_mapped(loaded) and loaded.shape == q_table.shape
+    assert np.allclose(loaded[7], q_table[7], atol=0.01)
+    assert (np.argmax(q_table, axis=1) == [np.argmax(loaded[state]) for state in range(500)]).mean() > 0.99
+    assert (tmp_path / "Q_table.json").exists() == (precision == "int16")
+
+def test_quantize():
+    data, scale = quantize(np.array([[0.0, -500.0], [80.0, 1.0]]))
+    assert data.dtype == np.int16 and data[0, 1] == -32767 and data[0, 0] == 0
+    assert np.allclose(data * scale, [[0, -500], [80, 1]], atol=scale)
+    assert quantize(np.zeros((2, 2)))[1] == 1.0
+
+def test_quantize_keeps_tried_actions():
+    q_table = np.array([[1e-4, -1e-4, 5.0], [1000.0, 0.0, 0.0]])
+    data, scale = quantize(q_table)
+    assert list(data[0, :2]) == [1, -1] and list(data[1, 1:]) == [0, 0]
+    quantized = QuantizedQTable(data, scale)
+    assert choose_action(quantized, 0, 0.0) == choose_action(q_table, 0, 0.0) == 2
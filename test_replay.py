@@ -0,0 +1,96 @@
+from snake import Snake, random_walk
+from replay import ReplayWriter, ReplayReader, load_game, open_game, is_replay
+
+def test_replay_roundtrip(tmp_path):
+    filename = tmp_path / "game.replay"
+    snake = Snake(history_mode="off")
+    expected = [snake._get_state()]
+
+    with ReplayWriter(filename, snake) as writer:
+        for res, _ in random_walk(snake, 500):
+            writer.record(snake)
+            expected.append(snake._get_state())
+            if not res:
+                break
+
+    assert is_replay(filename)
+    history = load_game(filename)
+
+    assert len(history) == len(expected)
+    for state, state_expected in zip(history, expected):
+        assert state["positions"] == state_expected["positions"]
+        assert state["dir"] == state_expected["dir"]
+        assert set(state["green_apples"]) == set(state_expected["green_apples"])
+        assert set(state["red_apples"]) == set(state_expected["red_apples"])
+
+def test_load_game_json(tmp_path):
+    filename = tmp_path / "game.json"
+    snake = Snake()
+    snake.move()
+    snake.save_game(filename)
+
+    assert not is_replay(filename)
+    assert len(load_game(filename)) == 2
+
+def test_open_game_board_size(tmp_path):
+    snake = Snake(board_size=20, history_mode="delta", seed=3)
+    expected = [snake._get_state()]
+    with ReplayWriter(tmp_path / "game.replay", snake) as writer:
+        for res, _ in random_walk(snake, 200):
+            writer.record(snake)
+            expected.append(snake._get_state())
+            if not res:
+                break
+    snake.save_game(tmp_path / "game.json")
+
+    for filename in ["game.json", "game.replay"]:
+        reader = open_game(tmp_path / filename)
+        assert reader.board_size == 20 and len(reader) == len(expected)
+        for index in [0, len(expected) // 2, len(expected) - 1]:
+            state = reader.seek(index)
+            assert state.board_size == 20 and state.positions == expected[index]["positions"]
+        reader.close()
+
+def test_replay_reader_seek(tmp_path):
+    filename = tmp_path / "game.replay"
+    snake = Snake(history_mode="off")
+    expected = [snake._get_state()]
+
+    with ReplayWriter(filename, snake) as writer:
+        for res, _ in random_walk(snake, 2000):
+            writer.record(snake)
+            expected.append(snake._get_state())
+            if not res:
+                snake.dir = (snake.dir + 1) % 4
+
+    with ReplayReader(filename, keyframe_interval=16) as reader:
+        assert len(reader) == len(expected)
+        assert len(reader.keyframes) == 2000 // 16 + 1
+        for index in [0, 5, 700, 3, 1999, 1998, 40, 41, 2000]:
+            state = reader.seek(index)._get_state()
+            assert state["positions"] == expected[index]["positions"]
+            assert state["dir"] == expected[index]["dir"]
+            assert set(state["green_apples"]) == set(expected[index]["green_apples"])
+
+def test_seeded_replay_stores_moves_only(tmp_path):
+    filename = tmp_path / "game.replay"
+    snake = Snake(history_mode="off", seed=1234)
+    expected = [snake._get_state()]
+
+    with ReplayWriter(filename, snake) as writer:
+        for res, _ in random_walk(snake, 500):
+            writer.record(snake)
+            expected.append(snake._get_state())
+            if not res:
+                snake.dir = (snake.dir + 1) % 4
+
+    with ReplayReader(filename, keyframe_interval=8) as reader:
+        assert reader.header["seed"] == 1234
+        assert len(reader.data) - reader.offsets[0] == len(expected) - 1
+        for index in [len(expected) - 1, 0, 17, 9]:
+            state = reader.seek(index)._get_state()
+            assert state["positions"] == expected[index]["positions"]
+            assert set(state["green_apples"]) == set(expected[index]["green_apples"])
+            assert set(state["red_apples"]) == set(expected[index]["red_apples"])
+
+    assert len(load_game(filename)) == len(expected)
@@ -1,5 +1,6 @@
 import pytest
-from snake import Snake, direction_after_turn, UP, RIGHT, DOWN, LEFT
+import random
+from snake import Snake, FreePositions, direction_after_turn, game_seed, load_history, ray_slices, random_walk, DIRECTIONS, UP, RIGHT, DOWN, LEFT
 from unittest.mock import patch
 
 def test_place_apples():
@@ -77,7 +78,7 @@ def test_get_free_random_position():
 
     fake_position = (2, 3)
 
-    with patch("random.choice", return_value=fake_position):
+    with patch.object(snake.rng, "choice", return_value=fake_position):
         assert snake._get_free_random_position() == fake_position
 
 def free_positions_integrity(snake):
@@ -194,3 +195,146 @@ def test_pop_tail():
 
     assert snake.positions == positions[:-1]
 
+
+def grid_integrity(snake):
+    for pos in snake.positions:
+        assert snake.tile_type(pos) == "snake"
+    for pos in snake.green_apple_positions:
+        assert snake.tile_type(pos) == "green"
+    for pos in snake.red_apple_positions:
+        assert snake.tile_type(pos) == "red"
+    for pos in snake.free_positions:
+        assert snake.tile_type(pos) == "empty"
+
+def test_grid_follows_moves():
+    snake = Snake()
+    for _ in range(200):
+        snake.turn(random.choice(["left", "right"]))
+        res, _ = snake.move()
+        grid_integrity(snake)
+        free_positions_integrity(snake)
+        if not res:
+            snake = Snake()
+
+def test_move_into_tail():
+    state = {
+        "positions": [(5, 5), (5, 6), (6, 6), (6, 5)],
+        "dir": DOWN,
+        "green_apples": [(0, 0)],
+        "red_apples": [(0, 1)],
+    }
+    snake = Snake(state=state)
+
+    assert snake.move() == (True, "empty")
+    assert snake.positions == [(6, 5), (5, 5), (5, 6), (6, 6)]
+    assert snake.get_head_position() == (6, 5)
+    grid_integrity(snake)
+    free_positions_integrity(snake)
+
+def play_random_game(snake, nmoves=300):
+    for res, _ in random_walk(snake, nmoves):
+        if not res:
+            break
+
+def test_history_off():
+    snake = Snake(history_mode="off")
+    play_random_game(snake)
+    assert len(snake.history) == 0
+
+def test_history_ring():
+    snake = Snake(history_mode="ring", history_size=5)
+    play_random_game(snake)
+    assert len(snake.history) <= 5
+    assert snake.history[-1]["positions"] == snake.positions
+
+def test_history_delta(tmp_path):
+    snake = Snake(history_mode="delta")
+    expected = [snake._get_state()]
+    for res, _ in random_walk(snake, 300):
+        expected.append(snake._get_state())
+        if not res:
+            break
+
+    filename = tmp_path / "game.json"
+    snake.save_game(filename)
+    history = load_history(filename)
+
+    assert len(history) == len(expected)
+    for state, state_expected in zip(history, expected):
+        assert [tuple(p) for p in state["positions"]] == state_expected["positions"]
+        assert state["dir"] == state_expected["dir"]
+        assert set(map(tuple, state["green_apples"])) == set(state_expected["green_apples"])
+        assert set(map(tuple, state["red_apples"])) == set(state_expected["red_apples"])
+
+def test_free_positions_pool():
+    pool = FreePositions(4, [(0, 0), (1, 2), (3, 3)])
+
+    pool.remove((0, 0))
+    assert (0, 0) not in pool
+    assert set(pool) == {(1, 2), (3, 3)}
+    assert pool.index[1 * 4 + 2] >= 0 and pool.cells[pool.index[3 * 4 + 3]] == (3, 3)
+
+    pool.discard((0, 0))
+    pool.add((3, 3))
+    assert len(pool) == 2
+    assert (5, 5) not in pool
+
+    with pytest.raises(KeyError):
+        pool.remove((0, 0))
+
+    assert pool.sample(random.Random(0)) in {(1, 2), (3, 3)}
+
+def test_seed_reproduces_game():
+    games = []
+    for _ in range(2):
+        snake = Snake(seed=42, history_mode="full")
+        for res, _ in random_walk(snake, 300, random.Random(0)):
+            if not res:
+                break
+        games.append(list(snake.history))
+    assert games[0] == games[1]
+
+def test_game_seed():
+    seeds = {game_seed(7, game) for game in range(1000)}
+    assert len(seeds) == 1000
+    assert game_seed(7, 3) != game_seed(8, 3)
+
+def test_snapshot_restore():
+    snake = Snake(seed=1, history_mode="off")
+    for _ in range(20):
+        snake.turn(random.choice(["left", "right"]))
+        snake.move()
+    copy = Snake(seed=2, history_mode="off")
+    copy.restore(snake.snapshot())
+    for _ in range(100):
+        snake.turn("left")
+        copy.turn("left")
+        assert snake.move() == copy.move()
+        assert snake._get_state() == copy._get_state()
+
+@pytest.mark.parametrize("board_size", [1, 4, 10])
+def test_ray_slices(board_size):
+    cells = list(range(board_size * board_size))
+    for cell, rays in enumerate(ray_slices(board_size)):
+        row, col = divmod(cell, board_size)
+        for dir, ray in enumerate(rays):
+            expected = []
+            r, c = row + DIRECTIONS[dir][0], col + DIRECTIONS[dir][1]
+            while 0 <= r < board_size and 0 <= c < board_size:
+                expected.append(r * board_size + c)
+                r, c = r + DIRECTIONS[dir][0], c + DIRECTIONS[dir][1]
+            assert cells[ray] == expected
+
+def test_zobrist_follows_moves():
+    for seed in range(20):
+        snake = Snake(seed=seed, history_mode="off")
+        assert snake.zobrist == snake.compute_zobrist()
+        for res, _ in random_walk(snake, 300):
+            assert snake.zobrist == snake.compute_zobrist()
+            if not res:
+                break
+
+    # Same board, same hash, whatever the history of the game
+    copy = Snake(seed=99, history_mode="off")
+    copy.restore(snake.snapshot())
+    assert copy.zobrist == snake.zobrist
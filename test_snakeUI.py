@@ -0,0 +1,30 @@
+import os
+import random
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+import pygame
+import pytest
+from snake import Snake, random_walk
+from snakeUI import UI
+
+
+@pytest.mark.parametrize("board_sizes", [[10], [50], [10, 20]])
+def test_dirty_rects_match_full_redraw(board_sizes):
+    ui = UI(turn_based=True)
+    rng = random.Random(0)
+    try:
+        for game, board_size in enumerate(board_sizes * 3):
+            snake = Snake(board_size=board_size, history_mode="off", seed=game)
+            ui.render(snake)
+            for result, _ in random_walk(snake, 100000, rng):
+                if not result:
+                    break
+                ui.render(snake)
+            ui.render(snake)
+            incremental = pygame.surfarray.array3d(ui.screen)
+
+            ui.invalidate()
+            ui.render(snake)
+            assert (pygame.surfarray.array3d(ui.screen) == incremental).all()
+    finally:
+        ui.quit()
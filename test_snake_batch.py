@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+from importlib import import_module
+from snake import Snake, UP, DOWN, LEFT, EMPTY, SNAKE, GREEN, RED, WALL
+from snake_batch import SnakeBatch
+from env import Env
+
+def grid_integrity(batch):
+    for i in range(batch.n):
+        positions = batch.get_positions(i)
+        assert len(set(positions)) == batch.length[i]
+        assert np.count_nonzero(batch.grid[i] == SNAKE) == batch.length[i]
+        assert np.count_nonzero(batch.grid[i] == GREEN) == np.count_nonzero(batch.green[i] >= 0)
+        assert np.count_nonzero(batch.grid[i] == RED) == np.count_nonzero(batch.red[i] >= 0)
+        assert batch.head[i] == positions[0][0] * batch.board_size + positions[0][1]
+
+def single_game(state):
+    batch = SnakeBatch(1)
+    batch.set_state(0, state)
+    return batch
+
+def test_reset():
+    batch = SnakeBatch(64, seed=0)
+    grid_integrity(batch)
+    assert (batch.length == 3).all()
+    assert (batch.green >= 0).all() and (batch.red >= 0).all()
+    assert not batch.done.any()
+
+def test_wall():
+    batch = single_game({"positions": [(0, 5), (1, 5), (2, 5)], "dir": UP, "green_apples": [(9, 9)], "red_apples": [(9, 0)]})
+    result, scenari, done = batch.step([2])
+    assert not result[0] and done[0] and scenari[0] == WALL
+    assert batch.get_positions(0) == [(0, 5), (1, 5), (2, 5)]
+
+def test_tail_is_vacated():
+    state = {"positions": [(5, 5), (5, 6), (6, 6), (6, 5)], "dir": LEFT, "green_apples": [(0, 0), (0, 1)], "red_apples": [(0, 2)]}
+    batch = single_game(state)
+    result, scenari, _ = batch.step([DOWN], "dir")
+    assert result[0] and scenari[0] == EMPTY
+    assert batch.get_positions(0) == [(6, 5), (5, 5), (5, 6), (6, 6)]
+    grid_integrity(batch)
+
+def test_green_and_red():
+    state = {"positions": [(5, 5), (5, 6)], "dir": LEFT, "green_apples": [(5, 4), (0, 0)], "red_apples": [(5, 3)]}
+    batch = single_game(state)
+
+    result, scenari, _ = batch.step([2])
+    assert result[0] and scenari[0] == GREEN and batch.length[0] == 3
+    assert (0, 0) in batch.get_state(0)["green_apples"]
+
+    result, scenari, _ = batch.step([2])
+    assert result[0] and scenari[0] == RED and batch.length[0] == 2
+    assert batch.get_positions(0) == [(5, 3), (5, 4)]
+    grid_integrity(batch)
+
+def test_red_kills_single_segment():
+    batch = single_game({"positions": [(5, 5)], "dir": LEFT, "green_apples": [], "red_apples": [(5, 4)]})
+    result, scenari, done = batch.step([2])
+    assert not result[0] and done[0] and scenari[0] == RED
+
+def test_done_games_do_not_move():
+    batch = single_game({"positions": [(0, 5)], "dir": UP, "green_apples": [], "red_apples": []})
+    batch.step([2])
+    result, _, done = batch.step([2])
+    assert not result[0] and done[0] and batch.moves[0] == 1
+
+@pytest.mark.parametrize("board_size", [10, 24])
+@pytest.mark.parametrize("model", ["v0", "v1", "v2", "v3"])
+def test_batch_state_to_index(model, board_size):
+    strategy = import_module(f"{model}.strategy")
+    batch = SnakeBatch(32, board_size, seed=1)
+    rng = np.random.default_rng(2)
+    for _ in range(50):
+        for i in range(batch.n):
+            snake = Snake(board_size=board_size, state=batch.get_state(i))
+            assert strategy.batch_state_to_index(batch)[i] == strategy.state_to_index(snake)
+        _, _, done = batch.step(rng.integers(3, size=batch.n))
+        batch.reset(done)
+
+@pytest.mark.parametrize("board_size", [10, 24])
+@pytest.mark.parametrize("model", ["v0", "v1", "v2", "v3"])
+def test_batch_reward(model, board_size):
+    strategy = import_module(f"{model}.strategy")
+    action_type = "dir" if model == "v3" else "turn"
+    batch = SnakeBatch(32, board_size, seed=3)
+    rng = np.random.default_rng(4)
+    for _ in range(50):
+        envs = []
+        for i in range(batch.n):
+            env = Env(strategy, action_type)
+            env.reset(Snake(board_size=board_size, state=batch.get_state(i), history_mode="off"))
+            envs.append(env)
+        actions = rng.integers(strategy.n_actions, size=batch.n)
+        res, scenari, done = batch.step(actions, action_type)
+        rewards = strategy.batch_reward(batch, res, scenari)
+        for i, env in enumerate(envs):
+            _, event, env_done = env.step(int(actions[i]))
+            assert env_done == done[i]
+            assert strategy.REWARDS[event] == rewards[i]
+        batch.reset(done)
+
+@pytest.mark.parametrize("board_size", [2, 10, 50])
+def test_hamiltonian_cycle(board_size):
+    strategy = import_module("v3.strategy")
+    cycle = strategy.hamiltonian_cycle(board_size)
+    assert len(set(cycle)) == board_size * board_size
+    for (row, col), (next_row, next_col) in zip(cycle, cycle[1:] + cycle[:1]):
+        assert abs(next_row - row) + abs(next_col - col) == 1
+    assert strategy.table_shape(board_size) == (board_size * board_size, 4)
+    with pytest.raises(ValueError):
+        strategy.table_shape(board_size + 1)
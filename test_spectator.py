@@ -0,0 +1,57 @@
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+import pygame
+from snake import Snake
+from snakeUI import UI
+from spectator import Spectator
+
+
+def play(nmoves, spectator=None):
+    """Plays seeded games, publishing every move, until nmoves or a stop."""
+    moves = 0
+    game = 0
+    while moves < nmoves and not spectator.stopped.is_set():
+        spectator.start_episode(game)
+        snake = Snake(history_mode="off", seed=game)
+        result = True
+        while result and moves < nmoves and not spectator.stopped.is_set():
+            if moves % 5 == 0:
+                snake.turn("right")
+            result, _ = snake.move()
+            spectator.publish(snake)
+            moves += 1
+        game += 1
+    return moves
+
+
+def test_quit_stops_the_loop():
+    ui = UI()
+    spectator = Spectator(ui, fps=1000)
+    pygame.event.post(pygame.event.Event(pygame.QUIT))
+    spectator.run(play, 10**9)
+    assert spectator.stopped.is_set()
+
+
+def test_follow_draws_every_move():
+    ui = UI()
+    drawn = []
+    render = ui.render
+    ui.render = lambda snake: drawn.append(snake.get_head_position()) or render(snake)
+
+    spectator = Spectator(ui, fps=1000)
+    spectator.follow_next = True
+    spectator.run(play, 20)
+
+    expected = Snake(history_mode="off", seed=0)
+    heads = []
+    for moves in range(20):
+        if moves % 5 == 0:
+            expected.turn("right")
+        result, _ = expected.move()
+        if not result:
+            break
+        heads.append(expected.get_head_position())
+    # The first episode is followed: each of its moves is drawn, in order
+    frames = [head for i, head in enumerate(drawn) if i == 0 or head != drawn[i - 1]]
+    assert frames[:len(heads)] == heads
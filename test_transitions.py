@@ -0,0 +1,48 @@
+import numpy as np
+from policy import q_update, mean_q_update
+from transitions import TransitionBuffer, ReplayLearner
+
+def test_ring_buffer():
+    buffer = TransitionBuffer(4)
+    for i in range(3):
+        buffer.add(i, 0, 1.0, i + 1)
+    buffer.add(3, 1, -5.0, None)
+    buffer.add(4, 2, 1.0, 5)
+    assert len(buffer) == 4
+    assert list(buffer.states) == [4, 1, 2, 3]
+    assert list(buffer.alive) == [True, True, True, False]
+
+    buffer.add_batch(np.arange(10, 16), np.zeros(6), np.ones(6), np.arange(11, 17), np.ones(6, dtype=bool))
+    assert len(buffer) == 4 and buffer.position == 1
+    assert sorted(buffer.states) == [12, 13, 14, 15]
+
+    states, actions, rewards, next_states, alive = buffer.sample(100, np.random.default_rng(0))
+    assert set(states) <= {12, 13, 14, 15}
+    assert (next_states == states + 1).all()
+
+def test_mean_q_update():
+    rng = np.random.default_rng(1)
+    q_table = rng.random((6, 3))
+    expected = q_table.copy()
+    # Distinct entries: same as one q_update per transition
+    states, actions = np.array([0, 1, 2]), np.array([2, 0, 1])
+    rewards, next_states, alive = np.array([1.0, -2.0, 3.0]), np.array([3, 4, 5]), np.array([True, False, True])
+    for s, a, r, n, ok in zip(states, actions, rewards, next_states, alive):
+        q_update(expected, s, a, r, n if ok else None, 0.1, 0.9)
+    mean_q_update(q_table, states, actions, rewards, next_states, alive, 0.1, 0.9)
+    assert np.allclose(q_table, expected)
+
+    # An entry repeated 1000 times moves by alpha, not 1000 * alpha
+    q_table = np.zeros((2, 1))
+    mean_q_update(q_table, np.zeros(1000, dtype=int), np.zeros(1000, dtype=int), np.full(1000, 10.0),
+                  np.ones(1000, dtype=int), np.zeros(1000, dtype=bool), 0.1, 0.9)
+    assert q_table[0, 0] == 1.0
+
+def test_replay_learner():
+    q_table = np.zeros((2, 2))
+    learner = ReplayLearner(q_table, 0.5, 0.9, capacity=100, batch_size=32, every=10, seed=0)
+    for _ in range(9):
+        learner.add(0, 1, 1.0, None)
+    assert not q_table.any()
+    learner.add(0, 1, 1.0, None)
+    assert q_table[0, 1] == 0.5 and learner.pending == 0
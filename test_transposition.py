@@ -0,0 +1,15 @@
+import random
+from snake import Snake, random_walk
+from transposition import TranspositionCache
+import v2.strategy
+
+def test_cache_matches_encoding():
+    cache = TranspositionCache(v2.strategy.state_to_index, maxsize=64)
+    snake = Snake(seed=3, history_mode="off")
+    for _ in range(500):
+        assert cache(snake) == v2.strategy.state_to_index(snake)
+        res, _ = next(random_walk(snake, 1))
+        if not res:
+            snake = Snake(seed=random.randrange(1000), history_mode="off")
+    assert cache.hits > 0
+    assert len(cache.cache) <= 64
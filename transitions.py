@@ -0,0 +1,119 @@
+import numpy as np
+from policy import mean_q_update
+from checkpoint import get_rng_state, set_rng_state
+from logger import logger as logging
+import instrument
+
+BUFFER_ARRAYS = ["states", "actions", "rewards", "next_states", "alive"]
+
+
+class TransitionBuffer:
+    """Ring buffer of the last `capacity` transitions, in preallocated arrays.
+
+    A terminal transition is stored with alive False (its next state is
+    ignored by the update)."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.states = np.zeros(capacity, dtype=np.int64)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float64)
+        self.next_states = np.zeros(capacity, dtype=np.int64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.position = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state):
+        """Stores one transition, next_state is None for a terminal move."""
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        if next_state is None:
+            self.alive[i] = False
+        else:
+            self.next_states[i] = next_state
+            self.alive[i] = True
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def add_batch(self, states, actions, rewards, next_states, alive):
+        """Stores a vector of transitions, overwriting the oldest ones."""
+        n = len(states)
+        if n > self.capacity:
+            states, actions, rewards, next_states, alive = (
+                array[-self.capacity:] for array in (states, actions, rewards, next_states, alive)
+            )
+            n = self.capacity
+        indices = (self.position + np.arange(n)) % self.capacity
+        self.states[indices] = states
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.next_states[indices] = next_states
+        self.alive[indices] = alive
+        self.position = (self.position + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def sample(self, n, rng):
+        """(states, actions, rewards, next_states, alive) of n transitions drawn uniformly."""
+        indices = rng.integers(self.size, size=n)
+        return (self.states[indices], self.actions[indices], self.rewards[indices],
+                self.next_states[indices], self.alive[indices])
+
+
+class ReplayLearner:
+    """Q-learning from a TransitionBuffer instead of after every move.
+
+    Transitions are only stored while playing. Every `every` new transitions,
+    batch_size of them are sampled from the buffer and applied at once with
+    mean_q_update, so each transition is learned batch_size / every times
+    on average."""
+
+    def __init__(self, q_table, alpha, gamma, capacity=100000, batch_size=1024, every=256, seed=None):
+        self.q_table = q_table
+        self.alpha = alpha
+        self.gamma = gamma
+        self.buffer = TransitionBuffer(capacity)
+        self.batch_size = batch_size
+        self.every = every
+        self.pending = 0
+        self.rng = np.random.default_rng(seed)
+        self.update = instrument.wrap("q_update", mean_q_update)
+
+    def add(self, state, action, reward, next_state):
+        self.buffer.add(state, action, reward, next_state)
+        self.pending += 1
+        if self.pending >= self.every:
+            self.learn()
+
+    def add_batch(self, states, actions, rewards, next_states, alive):
+        self.buffer.add_batch(states, actions, rewards, next_states, alive)
+        self.pending += len(states)
+        if self.pending >= self.every:
+            self.learn()
+
+    def learn(self):
+        """Applies one batch of sampled transitions to the Q-table."""
+        self.pending = 0
+        if len(self.buffer):
+            self.update(self.q_table, *self.buffer.sample(self.batch_size, self.rng), self.alpha, self.gamma)
+
+    def checkpoint_arrays(self):
+        """Copy of the buffer and of the sampling state, saved with the training checkpoints."""
+        buffer = self.buffer
+        arrays = {f"replay_{name}": getattr(buffer, name).copy() for name in BUFFER_ARRAYS}
+        arrays["replay_counters"] = np.array([buffer.position, buffer.size, self.pending])
+        arrays["replay_rng_state"] = get_rng_state(self.rng)
+        return arrays
+
+    def restore_arrays(self, arrays):
+        if "replay_counters" not in arrays or len(arrays["replay_states"]) != self.buffer.capacity:
+            logging.warning("No replay buffer of this size in the checkpoint, starting with an empty one")
+            return
+        for name in BUFFER_ARRAYS:
+            getattr(self.buffer, name)[...] = arrays[f"replay_{name}"]
+        self.buffer.position, self.buffer.size, self.pending = (int(n) for n in arrays["replay_counters"])
+        set_rng_state(self.rng, str(arrays["replay_rng_state"]))
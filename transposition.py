@@ -0,0 +1,35 @@
+from collections import OrderedDict
+
+
+class TranspositionCache:
+    """LRU memo of a function of the board, keyed by the Zobrist hash and direction of the snake.
+
+    (snake.zobrist, snake.dir) identifies the grid, the head and the
+    direction, which is all the strategies' state encodings look at. The
+    body order is not part of the key: functions depending on it must not
+    be cached."""
+
+    def __init__(self, function, maxsize=1 << 16):
+        self.function = function
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, snake):
+        key = (snake.zobrist, snake.dir)
+        cache = self.cache
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = self.function(snake)
+        cache[key] = value
+        if len(cache) > self.maxsize:
+            cache.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.cache.clear()
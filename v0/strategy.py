@@ -1,15 +1,15 @@
-from snake import  direction_after_turn, DIRECTIONS
+from snake import  direction_after_turn, DIRECTIONS, SNAKE, WALL, DEATH, BOARD_SIZE
 import numpy as np
 from logger import logger as logging
 
 def compute_danger(snake):
-    head = snake.positions[0]
+    head = snake.get_head_position()
     x, y = head
     dirs = [direction_after_turn(snake.dir, "left"), direction_after_turn(snake.dir, "right"), snake.dir]
     tiles = [(x + DIRECTIONS[dir][0], y + DIRECTIONS[dir][1]) for dir in dirs]
     dangers = [0, 0, 0]
     for i, tile in enumerate(tiles):
-        if tile in snake.positions or tile[0] < 0 or tile[0] >= snake.board_size or tile[1] < 0 or tile[1] >= snake.board_size:
+        if snake.tile_code(tile) in (SNAKE, WALL):
             dangers[i] = 1
     return dangers
 
@@ -18,6 +18,12 @@ def state_to_index(snake):
     [danger_left, danger_right, danger_center] = compute_danger(snake)
     return danger_left * 2**2 + danger_right * 2 + danger_center
 
+def batch_state_to_index(batch):
+    """state_to_index for every game of a SnakeBatch."""
+    tiles = np.stack([batch.neighbor_tiles(d) for d in batch.relative_dirs().T], axis=1)
+    dangers = (tiles == SNAKE) | (tiles == WALL)
+    return dangers[:, 0] * 2**2 + dangers[:, 1] * 2 + dangers[:, 2]
+
 def index_to_state(index):
     danger_center = index % 2
     index //= 2
@@ -34,22 +40,24 @@ def print_Q_table_entry(Q_table, index):
     logging.info(f"{state_label}: {actions}")
 
 
-def update_Q_table(Q_table, state, action, res, scenari, snake, alpha=0.1, gamma=0.01):
-    """Updates the Q-table using the Q-learning algorithm."""
-    reward = -1
+# Rewards indexed by event code (see reward_event)
+REWARDS = np.array([-1.0] * DEATH + [-500.0] * DEATH)
 
-    if res == False:
-        reward = -500
+def reward_event(event, snake, previous):
+    """Event code of a move, indexing REWARDS. previous is the (head, dir) before the move."""
+    return event
 
-    if res == False:
-        return alpha * (reward - Q_table[state][action])
-    else:
-        next_state = state_to_index(snake)
-        return alpha * (reward + gamma * np.max(Q_table[next_state]) - Q_table[state, action])
+def batch_reward(batch, res, scenari):
+    """Rewards of every game of a SnakeBatch."""
+    return REWARDS[scenari + DEATH * ~res]
 
 NSTATES = 2**3
 n_actions = 3
 Q_table = np.zeros((NSTATES, n_actions))
+
+def table_shape(board_size=BOARD_SIZE):
+    """Shape of the Q-table, the states do not depend on the board size."""
+    return (NSTATES, n_actions)
 # We notice that the table could converge really fast to the optimal solution
 # But because it gets a -500 when it dies from eating a red apple as well as hitting a wall, sometimes, some path can be not perfectly exact
 # We can test it now
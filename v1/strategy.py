@@ -1,28 +1,25 @@
-from snake import direction_after_turn, DIRECTIONS, UP, DOWN, LEFT, RIGHT
+from snake import direction_after_turn, ray_slices, DIRECTIONS, UP, DOWN, LEFT, RIGHT, SNAKE, GREEN, RED, WALL, DEATH, BOARD_SIZE
 import numpy as np
+import instrument
 from logger import logger as logging
 
 
 def _compute_danger(snake):
-    head = snake.positions[0]
+    head = snake.get_head_position()
     x, y = head
     dirs = [direction_after_turn(snake.dir, "left"), direction_after_turn(snake.dir, "right"), snake.dir]
-    logging.debug("Dirs: {dirs}")
     tiles = [(x + DIRECTIONS[dir][0], y + DIRECTIONS[dir][1]) for dir in dirs]
-    logging.debug(f"Tiles: {tiles}")
     dangers = [0, 0, 0]
     for i, tile in enumerate(tiles):
-        if tile in snake.positions or tile[0] < 0 or tile[0] >= snake.board_size or tile[1] < 0 or tile[1] >= snake.board_size:
+        if snake.tile_code(tile) in (SNAKE, WALL):
             dangers[i] = 1
 
-    logging.debug(f"Dangers: {dangers}")
-
     state_index = sum([val * (2**i) for i, val in enumerate(dangers)])
     return state_index
 
 def _compute_red_apple(snake):
     """Returns position of the red apple relative to the snake (None, Left, Right, Center)."""
-    head = snake.positions[0]
+    head = snake.get_head_position()
     if not snake.red_apple_positions:
         return 0  # No red apple
 
@@ -33,8 +30,6 @@ def _compute_red_apple(snake):
 
     tiles = [(head[0] + DIRECTIONS[d][0], head[1] + DIRECTIONS[d][1]) for d in directions]
 
-    logging.debug(f"Red apple: {red_apple}")
-    logging.debug(f"Tiles: {tiles}")
     if red_apple == tiles[0]:  # Left
         return 1
     elif red_apple == tiles[1]:  # Right
@@ -43,65 +38,26 @@ def _compute_red_apple(snake):
         return 3
     return 0  # No red apple
 
+# Bit of each absolute direction as seen by a snake heading to dir: GREEN_BITS[dir][ray]
+# Left is 1, right 2 and center 4, what is behind the head is not seen
+GREEN_BITS = [[0] * 4 for _ in range(4)]
+for _dir in (UP, RIGHT, DOWN, LEFT):
+    GREEN_BITS[_dir][direction_after_turn(_dir, "left")] = 1
+    GREEN_BITS[_dir][direction_after_turn(_dir, "right")] = 2
+    GREEN_BITS[_dir][_dir] = 4
+
 def _compute_green_apple(snake):
     """Returns the position of a green apple relative to the snake (before an obstacle)."""
-    head = snake.positions[0]
-    x, y = head
-    possible_states = [0] * 3  # [Left, Right, Center]
-
-    logging.debug(f"Green apples: {snake.green_apple_positions}")
-
-    for apple in snake.green_apple_positions:
-        dx, dy = apple[0] - x, apple[1] - y
-        logging.debug(f"Apple: {apple} dx, dy: {dx, dy}")
-
-        # Check if it's in line with the snake's movement
-        if (dx == 0 and dy != 0) or (dx != 0 and dy == 0):
-            blocked = False
-            tmp_x, tmp_y = x, y
-            while (tmp_x, tmp_y) != apple:
-                tmp_x += (dx > 0) - (dx < 0)
-                tmp_y += (dy > 0) - (dy < 0)
-                if (tmp_x, tmp_y) in snake.positions or (tmp_x, tmp_y) in snake.red_apple_positions:
-                    blocked = True
-                    break
-
-            direction = None
-            if not blocked:
-                if dy < 0:
-                    if snake.dir == UP:
-                        direction = "left"
-                    elif snake.dir == DOWN:
-                        direction = "right"
-                    elif snake.dir == LEFT:
-                        direction = "center"
-                elif dy > 0:
-                    if snake.dir == UP:
-                        direction = "right"
-                    elif snake.dir == DOWN:
-                        direction = "left"
-                    elif snake.dir == RIGHT:
-                        direction = "center"
-                elif dx < 0:
-                    if snake.dir == LEFT:
-                        direction = "right"
-                    elif snake.dir == RIGHT:
-                        direction = "left"
-                    elif snake.dir == UP:
-                        direction = "center"
-                elif dx > 0:
-                    if snake.dir == LEFT:
-                        direction = "left"
-                    elif snake.dir == RIGHT:
-                        direction = "right"
-                    elif snake.dir == DOWN:
-                        direction = "center"
-
-            if direction:
-                possible_states[["left", "right", "center"].index(direction)] = 1
-    logging.debug(f"Possible states: {possible_states}")
-
-    state_index = sum([val * (2**i) for i, val in enumerate(possible_states)])
+    head = snake.get_head_position()
+    rays = ray_slices(snake.board_size)[head[0] * snake.board_size + head[1]]
+    bits = GREEN_BITS[snake.dir]
+
+    state_index = 0
+    for ray, cells in enumerate(rays):
+        # A green apple is visible when it is the first thing met on the ray
+        seen = snake.grid[cells].lstrip(b"\x00")
+        if bits[ray] and seen and seen[0] == GREEN:
+            state_index |= bits[ray]
 
     return state_index
 
@@ -111,7 +67,21 @@ def state_to_index(snake):
     red_apple = _compute_red_apple(snake)
     green_apple = _compute_green_apple(snake)
 
-    logging.debug(f"State: {danger}, {red_apple}, {green_apple}")
+    if instrument.enabled:
+        instrument.trace("state", danger=danger, red=red_apple, green=green_apple)
+
+    return danger * (4 * 7) + red_apple * 7 + green_apple
+
+def batch_state_to_index(batch):
+    """state_to_index for every game of a SnakeBatch."""
+    dirs = batch.relative_dirs().T  # left, right, center
+    tiles = np.stack([batch.neighbor_tiles(d) for d in dirs], axis=1)
+    seen = np.stack([batch.ray_tiles(d) for d in dirs], axis=1)
+
+    danger = ((tiles == SNAKE) | (tiles == WALL)) @ np.array([1, 2, 4])
+    is_red = tiles == RED
+    red_apple = np.where(is_red.any(axis=1), np.argmax(is_red, axis=1) + 1, 0)
+    green_apple = (seen == GREEN) @ np.array([1, 2, 4])
 
     return danger * (4 * 7) + red_apple * 7 + green_apple
 
@@ -129,30 +99,28 @@ def print_Q_table(Q_table):
     for state in range(NSTATES):
         print_Q_table_entry(Q_table, state)
 
-def update_Q_table(Q_table, state, action, res, scenari, snake, alpha=0.1, gamma=0.9):
-    """Updates the Q-table using the Q-learning algorithm."""
-    reward = -1
-    if res == False and scenari != "red":
-        reward = -500
-    else:
-        if scenari == "red":
-            reward = -80
-        elif scenari == "green":
-            reward = 80
-
-    if res == False:
-        return alpha * (reward - Q_table[state][action])
-    else:
-        next_state = state_to_index(snake)
-        return alpha * (reward + gamma * np.max(Q_table[next_state]) - Q_table[state, action])
+# Rewards indexed by event code (see reward_event): the tile entered, plus DEATH when the move was fatal
+#                   empty  snake green  red   wall
+REWARDS = np.array([-1,    -1,   80,    -80,  -1,
+                    -500,  -500, -500,  -80,  -500], dtype=float)
 
+def reward_event(event, snake, previous):
+    """Event code of a move, indexing REWARDS. previous is the (head, dir) before the move."""
+    return event
 
+def batch_reward(batch, res, scenari):
+    """Rewards of every game of a SnakeBatch."""
+    return REWARDS[scenari + DEATH * ~res]
 
 NSTATES = 224  # 8 (Danger) * 4 (Red Apple) * 7 (Green Apple)
 n_actions = 3  # Left, Right, Forward
 
 Q_table = np.zeros((NSTATES, n_actions))
 
+def table_shape(board_size=BOARD_SIZE):
+    """Shape of the Q-table, the states do not depend on the board size."""
+    return (NSTATES, n_actions)
+
 
 # Encore bcp de comportements randoms
 # Le serpent devrait manger la pomme car il y a une pomme à côté et pas de mur mais il ne le fait pas
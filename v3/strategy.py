@@ -1,24 +1,27 @@
+import math
+from functools import lru_cache
 import numpy as np
+from snake import BOARD_SIZE
 from logger import logger as logging
 
 
 
 
 def state_to_index(snake):
-    """Returns a unique index for the state representation."""
-    row = snake.positions[0][0]
-    col = snake.positions[0][1]
+    """Returns a unique index for the state representation: the cell of the head."""
+    row, col = snake.get_head_position()
 
-    return row * 10 + col
+    return row * snake.board_size + col
 
-def index_to_state(index):
-    row = index // 10
-    col = index % 10
+def batch_state_to_index(batch):
+    """state_to_index for every game of a SnakeBatch."""
+    return batch.head
 
-    return row, col
+def index_to_state(index, board_size=BOARD_SIZE):
+    return divmod(index, board_size)
 
 def print_Q_table_entry(Q_table, index):
-    row, col = index_to_state(index)
+    row, col = index_to_state(index, _board_size(Q_table))
 
     state_label = f"row: {row} | col: {col}"
     actions = " | ".join(f"{Q_table[index, j]:.2f}" for j in range(n_actions))
@@ -28,49 +31,62 @@ def print_Q_table(Q_table):
     """Prints the Q-table in a readable format without affecting performance."""
 
     print("\nQ-table:")
-    for state in range(NSTATES):
+    for state in range(len(Q_table)):
         print_Q_table_entry(Q_table, state)
 
-hamiltonian_cycle = [
-    (0, 0),
-    (1, 0), (2, 0), (3, 0), (4, 0), (5, 0), (6, 0), (7, 0), (8, 0), (9, 0),
-    (9, 1), (8, 1), (7, 1), (6, 1), (5, 1), (4, 1), (3, 1), (2, 1), (1, 1),
-    (1, 2), (2, 2), (3, 2), (4, 2), (5, 2), (6, 2), (7, 2), (8, 2), (9, 2),
-    (9, 3), (8, 3), (7, 3), (6, 3), (5, 3), (4, 3), (3, 3), (2, 3), (1, 3),
-    (1, 4), (2, 4), (3, 4), (4, 4), (5, 4), (6, 4), (7, 4), (8, 4), (9, 4),
-    (9, 5), (8, 5), (7, 5), (6, 5), (5, 5), (4, 5), (3, 5), (2, 5), (1, 5),
-    (1, 6), (2, 6), (3, 6), (4, 6), (5, 6), (6, 6), (7, 6), (8, 6), (9, 6),
-    (9, 7), (8, 7), (7, 7), (6, 7), (5, 7), (4, 7), (3, 7), (2, 7), (1, 7),
-    (1, 8), (2, 8), (3, 8), (4, 8), (5, 8), (6, 8), (7, 8), (8, 8), (9, 8),
-    (9, 9), (8, 9), (7, 9), (6, 9), (5, 9), (4, 9), (3, 9), (2, 9), (1, 9),
-    (0, 9), (0, 8), (0, 7), (0, 6), (0, 5), (0, 4), (0, 3), (0, 2), (0, 1)
-]
-
-def update_Q_table(Q_table, state, action, res, scenari, snake, alpha=0.1, gamma=0.01):
-    """Updates the Q-table using the Q-learning algorithm."""
-    reward = -300
-
-
-    if update_Q_table.previous_pos:
-        hamiltonian_idx = hamiltonian_cycle.index(snake.positions[0])
-        if hamiltonian_idx == (hamiltonian_cycle.index(update_Q_table.previous_pos) + 1) % len(hamiltonian_cycle):
-            reward = 100
-    update_Q_table.previous_pos = snake.positions[0]
-
-    if res == False:
-        return alpha * (reward - Q_table[state][action])
-    else:
-        next_state = state_to_index(snake)
-        return alpha * (reward + gamma * np.max(Q_table[next_state]) - Q_table[state, action])
-
-update_Q_table.previous_pos = None
-
-
-NSTATES = 100  # 8 (Danger) * 4 (Red Apple) * 7 (Green Apple)
+@lru_cache(maxsize=None)
+def hamiltonian_cycle(board_size=BOARD_SIZE):
+    """Cells of a cycle going through every cell of an even-sized board once.
+
+    Down the first column, then up and down the other columns without their
+    first row, and back along the first row."""
+    if board_size % 2:
+        raise ValueError(f"Pas de cycle hamiltonien sur un plateau de taille impaire : {board_size}")
+    cycle = [(row, 0) for row in range(board_size)]
+    for col in range(1, board_size):
+        rows = range(board_size - 1, 0, -1) if col % 2 else range(1, board_size)
+        cycle += [(row, col) for row in rows]
+    cycle += [(0, col) for col in range(board_size - 1, 0, -1)]
+    return cycle
+
+@lru_cache(maxsize=None)
+def next_on_cycle(board_size=BOARD_SIZE):
+    """Cell (row * board_size + col) following each cell on the hamiltonian cycle."""
+    cycle = hamiltonian_cycle(board_size)
+    following = np.zeros(len(cycle), dtype=np.int64)
+    for i, (row, col) in enumerate(cycle):
+        next_row, next_col = cycle[(i + 1) % len(cycle)]
+        following[row * board_size + col] = next_row * board_size + next_col
+    return following
+
+# Rewards indexed by event code (see reward_event): 1 when the head followed the cycle
+REWARDS = np.array([-300.0, 100.0])
+
+def reward_event(event, snake, previous):
+    """Event code of a move, indexing REWARDS. previous is the (head, dir) before the move."""
+    head = snake.get_head_position()
+    row, col = previous[0]
+    size = snake.board_size
+    return int(next_on_cycle(size)[row * size + col] == head[0] * size + head[1])
+
+def batch_reward(batch, res, scenari):
+    """Rewards of every game of a SnakeBatch."""
+    return REWARDS[(next_on_cycle(batch.board_size)[batch.prev_head] == batch.head).astype(int)]
+
+
+NSTATES = BOARD_SIZE * BOARD_SIZE  # One state per cell
 n_actions = 4  # UP, LEFT, DOWN, RIGHT
 
 Q_table = np.zeros((NSTATES, n_actions))
 
+def table_shape(board_size=BOARD_SIZE):
+    """Shape of the Q-table for a board size: one state per cell."""
+    hamiltonian_cycle(board_size)  # Odd board sizes have no cycle to follow
+    return (board_size * board_size, n_actions)
+
+def _board_size(q_table):
+    return math.isqrt(len(q_table))
+
 
 
 
@@ -78,7 +94,7 @@ def print_learning_progress(q_table, verbose = "minimal"):
     visited_states = 0
     taken_actions = 0
     state_count = 0
-    for state in range(NSTATES):
+    for state in range(len(q_table)):
         state_count += 1
         taken_actions += np.count_nonzero(q_table[state])
         if np.any(q_table[state]):